@@ -0,0 +1,165 @@
+import sys
+import time
+import types
+
+from threading import Condition
+from collections import deque, namedtuple
+
+# In-process stand-in for the parts of echolib the GUI and docker manager use. Messages
+# are delivered by channel name inside this process, callbacks run on the thread that
+# calls IOLoop.wait of the subscribing client, as with the daemon.
+#
+# install() registers it as the echolib module, it must be called before gui_echolib
+# or docker_manager are imported.
+
+class Bus:
+
+    def __init__(self):
+
+        self.subscribers = {} # channel -> [(client, callback)]
+        self.sent = {}        # channel -> messages sent
+
+    def subscribe(self, channel, client, callback):
+
+        self.subscribers.setdefault(channel, []).append((client, callback))
+
+    def send(self, channel, message):
+
+        self.sent[channel] = self.sent.get(channel, 0) + 1
+
+        for client, callback in self.subscribers.get(channel, []):
+            client.deliver(callback, message)
+
+BUS = Bus()
+
+class Client:
+
+    def __init__(self, *args, **kwargs):
+
+        self.condition = Condition()
+        self.queue     = deque()
+        self.backlog_max = 0
+
+    def deliver(self, callback, message):
+
+        with self.condition:
+            self.queue.append((callback, message))
+            self.backlog_max = max(self.backlog_max, len(self.queue))
+            self.condition.notify()
+
+    def process(self, timeout: float) -> bool:
+
+        with self.condition:
+            if len(self.queue) == 0:
+                self.condition.wait(timeout)
+
+            pending = list(self.queue)
+            self.queue.clear()
+
+        for callback, message in pending:
+            callback(message)
+
+        return len(pending) > 0
+
+class IOLoop:
+
+    def __init__(self):
+
+        self.clients = []
+
+    def add_handler(self, client):
+
+        self.clients.append(client)
+
+    def wait(self, timeout: int = 10) -> bool:
+
+        # timeout in milliseconds like echolib, shared between the clients
+        for client in self.clients:
+            client.process(timeout/1000.0/max(1, len(self.clients)))
+
+        return True
+
+class MessageWriter:
+
+    def __init__(self):
+
+        self.values = []
+
+    def writeString(self, value: str):
+
+        self.values.append(str(value))
+
+    def writeInt(self, value: int):
+
+        self.values.append(int(value))
+
+class MessageReader:
+
+    def __init__(self, message):
+
+        self.values = deque(message.values)
+
+    def readString(self) -> str:
+
+        return self.values.popleft()
+
+    def readInt(self) -> int:
+
+        return self.values.popleft()
+
+class Publisher:
+
+    def __init__(self, client, channel: str, message_type: str):
+
+        self.channel = channel
+
+    def send(self, writer):
+
+        message = MessageWriter()
+        message.values = list(writer.values)
+
+        BUS.send(self.channel, message)
+
+class Subscriber:
+
+    def __init__(self, client, channel: str, message_type: str, callback):
+
+        self.channel = channel
+        BUS.subscribe(channel, client, callback)
+
+Header = namedtuple("Header", ["timestamp"])
+Frame  = namedtuple("Frame", ["image", "header"])
+
+class FrameSubscriber:
+
+    def __init__(self, client, channel: str, callback):
+
+        self.channel = channel
+        BUS.subscribe(channel, client, callback)
+
+class FramePublisher:
+
+    def __init__(self, client, channel: str):
+
+        self.channel = channel
+
+    def send(self, image, timestamp: float = None):
+
+        BUS.send(self.channel, Frame(image, Header(time.time() if timestamp is None else timestamp)))
+
+def install():
+
+    echolib = types.ModuleType("echolib")
+    camera  = types.ModuleType("echolib.camera")
+
+    for c in (IOLoop, Client, MessageWriter, MessageReader, Publisher, Subscriber):
+        setattr(echolib, c.__name__, c)
+
+    camera.FrameSubscriber = FrameSubscriber
+    camera.FramePublisher  = FramePublisher
+
+    echolib.camera = camera
+    echolib.bus    = BUS
+
+    sys.modules["echolib"] = echolib
+    sys.modules["echolib.camera"] = camera
@@ -0,0 +1,131 @@
+import time
+import numpy as np
+
+from threading import Thread
+
+import echolib
+from echolib.camera import FramePublisher
+
+from gui_decode import encode_frame
+
+class SyntheticStream:
+
+    # Publishes frames of the given size at a fixed rate on its own echolib client.
+    # Frames cycle through a few preallocated images, each stamped with its number
+    # in the first row so that producing them costs next to nothing. With encoding
+    # set to "jpeg" or "png" frames are sent encoded, as a remote node would.
+
+    def __init__(self, channel: str, width: int, height: int, fps: float, buffers: int = 4, encoding: str = None):
+
+        self.channel = channel
+        self.fps     = fps
+
+        self.loop   = echolib.IOLoop()
+        self.client = echolib.Client()
+        self.loop.add_handler(self.client)
+
+        self.publisher = FramePublisher(self.client, channel)
+
+        self.images = [np.full((height, width, 3), 32*i, dtype = np.uint8) for i in range(buffers)]
+        self.encoding = encoding
+
+        self.published = 0
+        self.running   = False
+        self.thread    = None
+
+    def start(self):
+
+        if self.running:
+            return
+
+        self.running = True
+        self.thread  = Thread(target = self.__publish, daemon = True)
+        self.thread.start()
+
+    def stop(self):
+
+        self.running = False
+
+        if self.thread is not None:
+            self.thread.join()
+
+    def __publish(self):
+
+        start = time.time()
+        sent  = 0
+
+        while self.running:
+
+            image = self.images[sent % len(self.images)]
+            image[0, :8, 0] = (self.published >> np.arange(0, 64, 8)) & 0xFF
+
+            self.publisher.send(image if self.encoding is None else encode_frame(image, self.encoding), time.time())
+            self.published += 1
+            sent += 1
+
+            delay = start + sent/self.fps - time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+
+class FakeDockerManager:
+
+    # Answers dockerIn commands like the docker manager: "1 tag" starts the synthetic
+    # demo output and replies on dockerOut, "-1 tag" stops it and reports docker_stoped.
+    # While a demo runs, containerReady is sent with every demo frame.
+
+    def __init__(self, demo_output: SyntheticStream):
+
+        self.demo_output = demo_output
+
+        self.loop   = echolib.IOLoop()
+        self.client = echolib.Client()
+        self.loop.add_handler(self.client)
+
+        self.docker_in     = echolib.Subscriber(self.client, "dockerIn", "string", self.__callback)
+        self.docker_out    = echolib.Publisher(self.client, "dockerOut", "string")
+        self.docker_stoped = echolib.Publisher(self.client, "docker_stoped", "string")
+        self.ready         = echolib.Publisher(self.client, "containerReady", "int")
+
+        self.active  = None
+        self.running = True
+
+        Thread(target = self.__run, daemon = True).start()
+
+    def __run(self):
+
+        sent = 0
+
+        while self.running and self.loop.wait(10):
+
+            if self.active is not None and self.demo_output.published > sent:
+                sent = self.demo_output.published
+
+                w = echolib.MessageWriter()
+                w.writeInt(1)
+                self.ready.send(w)
+
+    def __callback(self, message):
+
+        command = echolib.MessageReader(message).readString().split(" ")
+
+        if command[0] == "1":
+            self.active = command[1]
+            self.demo_output.start()
+
+            w = echolib.MessageWriter()
+            w.writeString("outContainer1 inContainer1")
+            self.docker_out.send(w)
+
+        elif command[0] == "-1" and self.active is not None:
+            self.demo_output.stop()
+
+            w = echolib.MessageWriter()
+            w.writeString(self.active)
+            self.docker_stoped.send(w)
+
+            self.active = None
+
+    def stop(self):
+
+        self.running = False
+        self.demo_output.stop()
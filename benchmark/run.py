@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+# Run from the repository root as python3 -m benchmark.run
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import fake_echolib
+
+# The GUI modules must see the in-process transport instead of echolib
+fake_echolib.install()
+
+from gui_echolib import EcholibHandler
+from gui_demo_discovery import load_demos
+
+from benchmark.publishers import SyntheticStream, FakeDockerManager
+
+class TextureUploader:
+
+    # Uploads frames into a texture of the hidden GUI window, or copies them into host
+    # memory when no OpenGL is used, standing in for DisplayTexture.
+
+    def __init__(self, use_gl: bool):
+
+        self.use_gl = use_gl
+        self.textures = {}
+        self.shapes   = {}
+        self.buffers  = {}
+
+    def upload(self, name: str, image: np.ndarray):
+
+        if not self.use_gl:
+            if name not in self.buffers or self.buffers[name].shape != image.shape:
+                self.buffers[name] = np.empty_like(image)
+            np.copyto(self.buffers[name], image)
+            return
+
+        from OpenGL.GL import glGenTextures, glBindTexture, glTexImage2D, glTexSubImage2D, glPixelStorei, glTexParameteri, \
+            GL_TEXTURE_2D, GL_RGB, GL_UNSIGNED_BYTE, GL_UNPACK_ALIGNMENT, GL_TEXTURE_MIN_FILTER, GL_LINEAR
+
+        image = np.ascontiguousarray(image)
+
+        if name not in self.textures:
+            self.textures[name] = glGenTextures(1)
+
+        glBindTexture(GL_TEXTURE_2D, self.textures[name])
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+
+        if self.shapes.get(name) != image.shape:
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, image.shape[1], image.shape[0], 0, GL_RGB, GL_UNSIGNED_BYTE, image)
+            self.shapes[name] = image.shape
+        else:
+            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, image.shape[1], image.shape[0], GL_RGB, GL_UNSIGNED_BYTE, image)
+
+def parse_size(text: str) -> tuple:
+
+    width, height = text.lower().split("x")
+
+    return int(width), int(height)
+
+def percentiles(values) -> dict:
+
+    if len(values) == 0:
+        return {}
+
+    p50, p95, p99 = np.percentile(np.array(values)*1000.0, [50, 95, 99])
+
+    return {"p50": p50, "p95": p95, "p99": p99}
+
+def git_commit() -> str:
+
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+
+    parser = argparse.ArgumentParser(description = "Benchmark of the GUI frame pipeline with synthetic publishers")
+    parser.add_argument("--camera-size", type = parse_size, default = (4024, 3036), help = "camera frame size, WxH")
+    parser.add_argument("--camera-fps",  type = float, default = 30.0)
+    parser.add_argument("--docker-size", type = parse_size, default = (4024, 3036), help = "demo output frame size, WxH")
+    parser.add_argument("--docker-fps",  type = float, default = 15.0)
+    parser.add_argument("--display-size", type = parse_size, default = (1260, 720), help = "window size the frames are downscaled for")
+    parser.add_argument("--encoding", type = str, default = None, choices = ["jpeg", "png"], help = "send frames encoded instead of raw")
+    parser.add_argument("--decode-workers", type = int, default = 2)
+    parser.add_argument("--downscale", type = str, default = "stride", help = "stride, area or off")
+    parser.add_argument("--demo", type = str, default = None, help = "demoId of the demo started and shown in the scene, the first demo by default")
+    parser.add_argument("--max-fps",  type = float, default = 60.0, help = "render loop rate limit")
+    parser.add_argument("--duration", type = float, default = 10.0, help = "seconds to measure")
+    parser.add_argument("--no-gl", action = "store_true", help = "copy frames in host memory at max-fps instead of rendering the GUI")
+    parser.add_argument("--output", type = str, default = None, help = "JSON file for the results, standard output by default")
+    args = parser.parse_args()
+
+    # The demo is started like from the drawer. With OpenGL it is shown in scene_primary,
+    # drawn into a hidden window by a loop like the one of gui_main.
+    demos = load_demos()
+    demo_key = args.demo if args.demo is not None else next(iter(demos.keys()))
+
+    if args.no_gl:
+        handler = EcholibHandler(downscale_method = args.downscale, decode_workers = args.decode_workers)
+        state   = None
+        scene   = None
+
+        camera_aspect_ratio = 4024.0/3036.0
+        handler.set_frame_target_size(args.display_size[1]*camera_aspect_ratio, args.display_size[1])
+    else:
+        from opengl_gui.gui_components import Gui
+        from opengl_gui.gui_helper     import load_font
+
+        from gui_main     import State, SceneResources, scene_primary
+        from gui_texture_stream import StreamingDisplayTexture
+        from gui_headless import prepare_headless
+
+        prepare_headless()
+
+        state   = State(downscale_method = args.downscale, max_fps = args.max_fps, frame_ring = None, decode_workers = args.decode_workers)
+        handler = state.echolib_handler
+
+        gui  = Gui(fullscreen = False, width = args.display_size[0], height = args.display_size[1])
+        font = load_font(path = "./res/fonts/Metropolis-SemiBold.otf")
+
+        resources = SceneResources(gui.width, gui.height, font, background_video = True)
+        demos     = resources.demos
+
+        # Restored on screen by scene_primary like after a rebuild
+        state.active_demo = demo_key
+
+        scene = scene_primary(gui.width, gui.height, state, resources, texture_streaming = True)
+        scene.update_geometry(parent = None)
+
+    # Stream figures come from plain views consumed every frame, like the calibration
+    # display does for the camera. The demo scene holds or hides demo frames depending
+    # on its own state, so its display would measure the demo instead of the pipeline.
+    # The views are read before the scene, which then draws on top of them.
+    camera_view = handler.camera_view()
+    docker_view = handler.docker_view()
+    uploader    = TextureUploader(use_gl = not args.no_gl)
+
+    camera      = SyntheticStream("camera_stream_0", *args.camera_size, args.camera_fps, encoding = args.encoding)
+    demo_output = SyntheticStream("docker_demo_output", *args.docker_size, args.docker_fps, encoding = args.encoding)
+    manager     = FakeDockerManager(demo_output)
+
+    camera.start()
+    handler.append_command((handler.docker_publisher, "{} {}".format(1, demos[demo_key]["cfg"]["dockerId"])))
+
+    frame_times = []
+    frames = 0
+    start  = time.time()
+
+    while time.time() - start < args.duration:
+
+        if scene is not None:
+            # Blocks until a frame is due, like the kiosk's loop
+            state.render_scheduler.wait()
+
+        frame_start = time.time()
+
+        if scene is not None:
+            gui.poll_events()
+            gui.clear_screen()
+
+        image = docker_view.get()
+        if image is not None:
+            uploader.upload("demo", image)
+
+        image = camera_view.get()
+        if image is not None:
+            uploader.upload("camera", image)
+
+        if scene is not None:
+            state.render_scheduler.track_animations(scene)
+            scene.execute(parent = None, gui = gui, custom_data = state)
+            StreamingDisplayTexture.release_retired()
+            gui.swap_buffers()
+
+        handler.latency.displayed()
+
+        frames += 1
+        frame_times.append(time.time() - frame_start)
+
+        if scene is None:
+            delay = frame_start + 1.0/args.max_fps - time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+
+    elapsed = time.time() - start
+
+    manager.stop()
+    camera.stop()
+    handler.close()
+
+    if scene is not None:
+        import glfw
+        glfw.terminate()
+
+    latency = handler.get_latency_statistics()
+    streams = {}
+
+    for name, stream in (("camera_stream_0", camera), ("docker_demo_output", demo_output)):
+        s = latency.get(name, {})
+
+        streams[name] = {
+            "published": stream.published,
+            "received":  s.get("received", 0),
+            "displayed": s.get("displayed", 0),
+            "dropped":   stream.published - s.get("displayed", 0),
+            "published_fps": stream.published/elapsed,
+            "displayed_fps": s.get("displayed", 0)/elapsed,
+            "latency_ms": {k: v for k, v in s.items() if isinstance(v, dict)}}
+
+    results = {
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "render": {"frames": frames, "fps": frames/elapsed, "frame_time_ms": percentiles(frame_times)},
+        "streams": streams,
+        "commands": handler.get_command_metrics(),
+        "decode": handler.get_decode_metrics()}
+
+    text = json.dumps(results, indent = 4, default = float)
+
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
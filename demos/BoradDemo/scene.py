@@ -1,5 +1,7 @@
 from opengl_gui.gui_components import *
 
+from gui_detections import DetectionOverlay
+
 import time
 
 def get_scene(parameters):
@@ -29,19 +31,33 @@ def get_scene(parameters):
         on_click = toggle_detection,
         id       = "demo_toggle_detection_button")
 
-    button_text = TextField(
-        colour   = [1.0, 1.0, 1.0, 1.0],
-        position = [0.25, 0.65,],
-        text_scale = 0.5,
-        aspect_ratio = parameters.aspect, 
-        id       = "demo_toggle_text")
-    button_text.set_text(text = "Razpoznaj", font = parameters.font)
-    button_text.center_x()
-    button_text.center_y()
-
-    button_text.depends_on(element = button_detection)
+    # Text scales are fixed at construction, set_aspect creates the text again
+    def create_button_text(aspect: float) -> TextField:
+
+        button_text = TextField(
+            colour   = [1.0, 1.0, 1.0, 1.0],
+            position = [0.25, 0.65,],
+            text_scale = 0.5,
+            aspect_ratio = aspect, 
+            id       = "demo_toggle_text")
+        button_text.set_text(text = "Razpoznaj", font = parameters.font)
+        button_text.center_x()
+        button_text.center_y()
+        button_text.depends_on(element = button_detection)
+
+        return button_text
+
+    button_text = create_button_text(parameters.aspect)
     button_detection.center_x()
 
+    camera_view = parameters.state.echolib_handler.camera_view()
+    docker_view = parameters.state.echolib_handler.docker_view()
+
+    # Detections sent instead of an annotated frame are drawn over the live camera
+    # while it shows the frames they belong to. Without sequence numbers in the frame
+    # headers they are held as long as an annotated frame would be.
+    detection_overlay = DetectionOverlay(parameters.state.echolib_handler, parameters.font, parameters.aspect, max_age = 5.0)
+
     def get_docker_texture(gui: Gui, state):
 
         echolib_handler = state.echolib_handler
@@ -49,19 +65,33 @@ def get_scene(parameters):
         if not echolib_handler.docker_channel_ready:
             return None
 
-        frame        = echolib_handler.get_image()
-        camera_image = echolib_handler.get_camera_stream()
+        frame = docker_view.get()
 
         if frame is not None:
             state.board_detection_time = time.time()
 
+            # The detection replaces the camera image in the texture
+            camera_view.invalidate()
+            button_detection.set_colour(colour = vicos_red)
+
+            return frame
+
         if state.board_detection_time is None or (time.time() - state.board_detection_time > 5.0):
 
             state.board_detection_time = None
             
-            return camera_image
+            return camera_view.get()
+
+        # Detection is still on display, keep the uploaded texture
+        return None
+
+    def set_aspect(aspect: float):
+
+        nonlocal button_text
+
+        button_detection.dependent_components.remove(button_text)
+        button_text = create_button_text(aspect)
 
-        button_detection.set_colour(colour = vicos_red)
-        return frame
+        detection_overlay.set_aspect(aspect)
 
-    return {"get_docker_texture": get_docker_texture, "elements": [button_detection]}
\ No newline at end of file
+    return {"get_docker_texture": get_docker_texture, "elements": [detection_overlay, button_detection], "set_aspect": set_aspect}
\ No newline at end of file
@@ -1,5 +1,7 @@
 from opengl_gui.gui_components import *
 
+from gui_detections import DetectionOverlay
+
 def get_scene(parameters):
     
     parameters.state.traffic_detection = 0
@@ -7,6 +9,12 @@ def get_scene(parameters):
     vicos_gray = [85.0/255.0, 85.0/255.0, 85.0/255.0, 0.75]
     vicos_red  = [226.0/255, 61.0/255, 40.0/255.0, 0.75]
 
+    camera_view = parameters.state.echolib_handler.camera_view()
+    docker_view = parameters.state.echolib_handler.docker_view()
+
+    # A container sending detections instead of annotated frames keeps the camera live
+    detection_overlay = DetectionOverlay(parameters.state.echolib_handler, parameters.font, parameters.aspect, max_age = 0.5)
+
     def get_docker_texture(gui: Gui, state):
 
         echolib_handler = state.echolib_handler
@@ -14,7 +22,10 @@ def get_scene(parameters):
         if not echolib_handler.docker_channel_ready:
             return None
         
-        return echolib_handler.get_image() if state.traffic_detection == 1 else echolib_handler.get_camera_stream()
+        if state.traffic_detection == 1 and not detection_overlay.receiving():
+            return docker_view.get()
+
+        return camera_view.get()
 
     def toggle_detection(button: Button, gui: Gui, state):
 
@@ -23,6 +34,10 @@ def get_scene(parameters):
             toggle = button.mouse_click_count % 2
             state.traffic_detection = toggle
 
+            # The texture source changes, upload the current frame of the new source
+            camera_view.invalidate()
+            docker_view.invalidate()
+
             if toggle == 1:
                 button.set_colour(colour = vicos_gray)
             else:
@@ -39,18 +54,32 @@ def get_scene(parameters):
         on_click = toggle_detection,
         id       = "demo_traffic_toggle_button")
 
-    button_text = TextField(
-        colour   = [1.0, 1.0, 1.0, 1.0],
-        position = [0.25, 0.65,],
-        text_scale = 0.5,
-        aspect_ratio = parameters.aspect, 
-        id = "demo_traffic_text")
+    # Text scales are fixed at construction, set_aspect creates the text again
+    def create_button_text(aspect: float) -> TextField:
 
-    button_text.set_text(font = parameters.font, text = "Vključi detekcijo")
-    button_text.center_x()
-    button_text.center_y()
+        button_text = TextField(
+            colour   = [1.0, 1.0, 1.0, 1.0],
+            position = [0.25, 0.65,],
+            text_scale = 0.5,
+            aspect_ratio = aspect, 
+            id = "demo_traffic_text")
+        button_text.set_text(font = parameters.font, text = "Vključi detekcijo")
+        button_text.center_x()
+        button_text.center_y()
+        button_text.depends_on(element = button_detection)
 
-    button_text.depends_on(element = button_detection)
+        return button_text
+
+    button_text = create_button_text(parameters.aspect)
     button_detection.center_x()
 
-    return {"get_docker_texture": get_docker_texture, "elements": [button_detection]}
\ No newline at end of file
+    def set_aspect(aspect: float):
+
+        nonlocal button_text
+
+        button_detection.dependent_components.remove(button_text)
+        button_text = create_button_text(aspect)
+
+        detection_overlay.set_aspect(aspect)
+
+    return {"get_docker_texture": get_docker_texture, "elements": [detection_overlay, button_detection], "set_aspect": set_aspect}
\ No newline at end of file
@@ -2,15 +2,42 @@ import echolib
 
 import docker
 import time
+import argparse
 
-from threading import Thread, Lock
+from threading import Thread, Condition, Event
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from shm_ring import SharedFrameRing
 
 class DockerManager():
 
-    def __init__(self):
+    def __init__(self, pool_size = 0, frame_ring = None, frame_ring_slots = 4, frame_ring_slot_bytes = 4024*3036*3):
         self.active_container = [None, None]
         self.docker          = docker.from_env()
 
+        # Shared memory frame ring mounted into the demo containers next to the echolib
+        # socket, containers find its name in VICOS_FRAME_RING. See shm_ring.
+        self.frame_ring = None
+        self.container_volumes     = {"/tmp/echo.sock" : {"bind" : "/tmp/echo.sock", "mode" : "rw"}}
+        self.container_environment = {}
+
+        if frame_ring is not None:
+            self.frame_ring = SharedFrameRing.create(frame_ring, frame_ring_slots, frame_ring_slot_bytes)
+
+            self.container_volumes["/dev/shm/" + frame_ring] = {"bind" : "/dev/shm/" + frame_ring, "mode" : "rw"}
+            self.container_environment["VICOS_FRAME_RING"] = frame_ring
+
+        # Warm-standby pool. Containers of demos that are switched away from are paused
+        # instead of stopped and kept here (least recently used first), so switching back
+        # to them only needs an unpause. A paused container does not publish on
+        # docker_demo_output, so only the active one feeds the GUI.
+        self.pool_size      = pool_size
+        self.container_pool = OrderedDict()
+
+        # Container teardown runs here so it overlaps with starting the next demo
+        self.workers = ThreadPoolExecutor(max_workers = 2)
+
         self.pyecho_loop   = echolib.IOLoop()
         self.pyecho_client = echolib.Client()
         self.pyecho_loop.add_handler(self.pyecho_client)
@@ -19,61 +46,296 @@ class DockerManager():
         self.pyecho_docker_out = echolib.Publisher(self.pyecho_client, "dockerOut", "string")
         self.pyecho_docker_stoped = echolib.Publisher(self.pyecho_client, "docker_stoped", "string")
 
-        self.command     = None
-        self.command_lock = Lock()
+        # FIFO of (command, enqueue time) filled by the echolib callback. Nothing is
+        # dropped, the processing thread blocks on the condition until commands arrive.
+        self.commands          = deque()
+        self.command_condition = Condition()
+        self.command_metrics   = {"received": 0, "coalesced": 0, "dispatched": 0,
+                                  "wait_last": 0.0, "wait_max": 0.0, "wait_total": 0.0,
+                                  "run_last": 0.0,  "run_max": 0.0,  "run_total": 0.0}
         self.stop        = False
 
+        # Tag -> image id index used on the run path instead of listing all images.
+        # The dictionary is only ever replaced as a whole, so lookups need no lock.
+        # It is rebuilt periodically and whenever docker reports an image event.
+        self.image_index          = {}
+        self.image_index_interval = 60.0
+        self.image_index_refresh  = Event()
+
+        self.__refresh_image_index()
+
+        Thread(target = self.__image_index_loop, daemon = True).start()
+        Thread(target = self.__image_events_loop, daemon = True).start()
+
         self.pyecho_loop.wait(10)
 
     def process(self):
 
-        #start = time.time()
+        while not self.stop:
+
+            with self.command_condition:
+                while len(self.commands) == 0 and not self.stop:
+                    self.command_condition.wait(0.1)
+
+                pending = list(self.commands)
+                self.commands.clear()
+
+            for command, enqueued in self.__coalesce(pending):
+
+                started = time.time()
+                self.__dispatch(command)
+                finished = time.time()
+
+                self.__record_timing(command, started - enqueued, finished - started)
+
+    def __dispatch(self, command):
+
+        if command[0] == "1":   # Run container
+            print("Run container with id {}".format(command[1]))
+
+            image_id = self.image_index.get(command[1])
+
+            if image_id is not None:
+                print("Image with matching tag found...")
+
+                if self.active_container[0] != command[1]:
+
+                    # Tear the previous container down on the worker pool while the new one
+                    # is started, so a switch takes as long as the slower of the two.
+                    previous = self.__detach_active_container()
+                    teardown = None
+
+                    if previous[0] is not None:
+                        teardown = self.workers.submit(self.__teardown, previous[1])
+
+                    try:
+                        container = self.__take_from_pool(command[1])
+
+                        if container is None:
+                            container = self.docker.containers.run(image_id,\
+                                device_requests=[docker.types.DeviceRequest(count=1, driver="nvidia", capabilities=[['gpu']])],\
+                                remove=True, detach=True,\
+                                volumes = self.container_volumes, environment = self.container_environment)
+                    except:
+                        print("Error starting docker container {}...".format(command[1]))
+                        container = None
+
+                    # Feedback is only published from this thread and in the same order as
+                    # before: docker_stoped for the old demo first, then dockerOut for the new.
+                    if teardown is not None:
+                        self.__release_finished(previous[0], previous[1], teardown.result())
+
+                    # Nothing is active now, the GUI gets no dockerOut for the failed demo
+                    if container is None:
+                        return
+
+                    self.active_container[0] = command[1]
+                    self.active_container[1] = container
+
+                output_channel = "outContainer" + str(command[0])
+                input_channel  = "inContainer"  + str(command[0])
+
+                print(f"{output_channel} {input_channel}")
+
+                w = echolib.MessageWriter()
+                w.writeString(output_channel + " " + input_channel)
+                self.pyecho_docker_out.send(w)
+            else:
+                print("No image with tag {} found...".format(command[1]))
+
+                # The image might have been built after the last refresh
+                self.image_index_refresh.set()
+
+
+        elif command[0] == "-1": # Stop container
+            print("Stopping contianer {}".format(command[1]))
+            self.release_active_container()
+
+    def __coalesce(self, pending):
+
+        # Reduce a batch of commands to its net effect on the active container so
+        # that stop/start pairs cancelling each other never reach docker.
+        # A run command replaces the active container when its image exists,
+        # a stop command stops whatever is active.
+
+        if len(pending) <= 1:
+            return [(c.split(" "), t) for c, t in pending]
+
+        initial = active = self.active_container[0]
+        run = False
+
+        for c, t in pending:
+            command = c.split(" ")
+
+            if command[0] == "1":
+                if command[1] in self.image_index:
+                    active = command[1]
+                    run = True
+                else:
+                    print("No image with tag {} found...".format(command[1]))
+
+                    # The image might have been built after the last refresh
+                    self.image_index_refresh.set()
+
+            elif command[0] == "-1":
+                active = None
+                run = False
+
+        enqueued = pending[0][1]
+        self.command_metrics["coalesced"] += len(pending)
+
+        # A batch ending in a run of the already active demo still needs its dockerOut
+        # reply, __dispatch sends it without restarting the container
+        if active is None:
+            result = [] if initial is None else [(["-1", initial], enqueued)]
+        elif active != initial or run:
+            result = [(["1", active], enqueued)]
+        else:
+            result = []
+
+        self.command_metrics["coalesced"] -= len(result)
+
+        if len(result) < len(pending):
+            print("Coalesced {} commands into {}".format(len(pending), [" ".join(c) for c, t in result]))
+
+        return result
+
+    def __record_timing(self, command, wait, run):
+
+        m = self.command_metrics
+
+        m["dispatched"] += 1
+        m["wait_last"]   = wait
+        m["wait_max"]    = max(m["wait_max"], wait)
+        m["wait_total"] += wait
+        m["run_last"]    = run
+        m["run_max"]     = max(m["run_max"], run)
+        m["run_total"]  += run
+
+        print("Command {} waited {:.2f} ms, executed in {:.2f} ms".format(" ".join(command), wait*1000.0, run*1000.0))
+
+    def __refresh_image_index(self):
+
+        index = {}
+
+        try:
+            for image in self.docker.images.list():
+                for tag in image.tags:
+                    index[tag] = image.id
+        except:
+            print("Error listing docker images...")
+            return
+
+        self.image_index = index
+
+    def __image_index_loop(self):
 
         while not self.stop:
+            self.image_index_refresh.wait(self.image_index_interval)
+            self.image_index_refresh.clear()
+
+            self.__refresh_image_index()
+
+    def __image_events_loop(self):
+
+        try:
+            for event in self.docker.events(decode = True, filters = {"type": "image"}):
+
+                print("Image event {}, refreshing image index...".format(event.get("Action")))
+                self.image_index_refresh.set()
 
-            command = None
+        except:
+            print("Docker image event stream closed...")
 
-            self.command_lock.acquire()
-            if self.command is not None:
-                command = self.command.split(" ")
-                self.command = None
-            self.command_lock.release()
+    def release_active_container(self):
 
-            if command is not None:
-                
-                if command[0] == "1":   # Run container
-                    print("Run container with id {}".format(command[1]))
+        tag, container = self.__detach_active_container()
 
-                    for image in self.docker.images.list():
-                        
-                        if len(image.tags) > 0 and image.tags[0] == command[1]:
-                            print("Image with matching tag found...")
+        if tag is not None:
+            self.__release_finished(tag, container, self.__teardown(container))
 
-                            flag = self.__handle_container(command[1])
+    def __detach_active_container(self):
 
-                            output_channel = "outContainer" + str(command[0])
-                            input_channel  = "inContainer"  + str(command[0])
+        tag, container = self.active_container
+        self.active_container[0] = self.active_container[1] = None
 
-                            print(f"{output_channel} {input_channel}")
+        return tag, container
+
+    def __teardown(self, container):
+
+        # Runs on the worker pool while the next container is being started, so it must
+        # not publish on echolib or touch the pool. Returns how the container was released.
+
+        if self.pool_size > 0:
+            try:
+                container.pause()
+                return "paused"
+            except:
+                print("Error pausing docker container...")
 
-                            w = echolib.MessageWriter()
-                            w.writeString(output_channel + " " + input_channel)
-                            self.pyecho_docker_out.send(w)
-                            
-                            if flag:
+        # Without a pool, or when the container can not be parked, it is simply stopped
+        try:
+            container.stop()
+            return "stopped"
+        except:
+            print("Error stopping docker container...")
 
-                                self.active_container[0] = command[1]
-                                self.active_container[1] = self.docker.containers.run(image.id,\
-                                    device_requests=[docker.types.DeviceRequest(count=1, driver="nvidia", capabilities=[['gpu']])],\
-                                    remove=True, detach=True,\
-                                    volumes = {"/tmp/echo.sock" : {"bind" : "/tmp/echo.sock", "mode" : "rw"}})
+        return None
 
+    def __release_finished(self, tag, container, result):
 
-                elif command[0] == "-1": # Stop container
-                    print("Stopping contianer {}".format(command[1]))
-                    self.stop_active_container()
+        if result is None:
+            return
 
-            time.sleep(0.3)
+        w = echolib.MessageWriter()
+        w.writeString(tag)
+        self.pyecho_docker_stoped.send(w)
+
+        if result == "paused":
+            self.container_pool[tag] = container
+            print("Container {} parked in pool...".format(tag))
+
+            while len(self.container_pool) > self.pool_size:
+                evicted_tag, evicted = self.container_pool.popitem(last = False)
+                print("Evicting container {} from pool...".format(evicted_tag))
+
+                # Nothing waits for an evicted container, let it stop in the background
+                self.workers.submit(self.__stop_pooled, evicted)
+
+    def stop_pool(self):
+
+        while len(self.container_pool) > 0:
+            tag, container = self.container_pool.popitem(last = False)
+            self.__stop_pooled(container)
+
+    def __take_from_pool(self, tag):
+
+        container = self.container_pool.pop(tag, None)
+
+        if container is not None:
+            try:
+                container.unpause()
+                print("Container {} resumed from pool...".format(tag))
+            except:
+                print("Error resuming pooled docker container...")
+                self.__stop_pooled(container)
+                container = None
+
+        return container
+
+    def __stop_pooled(self, container):
+
+        # A paused container is stopped even when unpausing it fails, it would
+        # otherwise keep running and hold GPU memory
+        try:
+            container.unpause()
+        except:
+            print("Error unpausing pooled docker container...")
+
+        try:
+            container.stop()
+        except:
+            print("Error stopping pooled docker container...")
         
     def stop_active_container(self):
 
@@ -90,24 +352,32 @@ class DockerManager():
 
             self.active_container[0] = self.active_container[1] = None
 
-    def __handle_container(self, tag):
-        
-        if self.active_container[0] != tag:
-            self.stop_active_container()
-
-            return True
+    def __callback(self, message):
 
-        return False
+        command = echolib.MessageReader(message).readString()
+        print("Got command: {}".format(command))
 
-    def __callback(self, message):
+        with self.command_condition:
+            self.commands.append((command, time.time()))
+            self.command_metrics["received"] += 1
 
-        self.command_lock.acquire()
-        self.command = echolib.MessageReader(message).readString()
-        print("Got command: {}".format(self.command))
-        self.command_lock.release()
+            self.command_condition.notify()
 
 def main():
-    dm = DockerManager()
+
+    parser = argparse.ArgumentParser(description = "Vicos demo docker manager")
+    parser.add_argument("--pool", type = int, default = 0,
+        help = "number of idle demo containers kept paused for fast switching (0 disables the pool)")
+    parser.add_argument("--frame-ring", type = str, default = None,
+        help = "name of a shared memory frame ring to create and mount into demo containers")
+    parser.add_argument("--frame-ring-slots", type = int, default = 4,
+        help = "number of frames the shared memory ring holds")
+    parser.add_argument("--frame-ring-slot-mb", type = float, default = 36.0,
+        help = "size of one frame ring slot in MiB, must fit the largest demo frame")
+    args = parser.parse_args()
+
+    dm = DockerManager(pool_size = args.pool, frame_ring = args.frame_ring,
+        frame_ring_slots = args.frame_ring_slots, frame_ring_slot_bytes = int(args.frame_ring_slot_mb*1024*1024))
 
     th = Thread(target = dm.process)
     th.start()
@@ -124,6 +394,11 @@ def main():
     th.join()
 
     dm.stop_active_container()
+    dm.stop_pool()
+    dm.workers.shutdown(wait = True)
+
+    if dm.frame_ring is not None:
+        dm.frame_ring.close()
     
 
 if __name__ == '__main__':
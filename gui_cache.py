@@ -0,0 +1,165 @@
+import os
+import cv2
+import json
+import hashlib
+import numpy as np
+
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "vicos_demo_gui")
+
+def cache_directory(name: str) -> str:
+
+    directory = os.path.join(CACHE_ROOT, name)
+    os.makedirs(directory, exist_ok = True)
+
+    return directory
+
+def evict(directory: str, budget: int):
+
+    # Removes least recently used files until the directory fits into budget bytes.
+    # Cache hits touch their file, so modification time orders entries by use.
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(e[1] for e in entries)
+
+    for mtime, size, path in sorted(entries):
+        if total <= budget:
+            break
+
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def cached_rasterize_svg(path: str, width: float, height: float, budget: int = 16*1024*1024) -> np.ndarray:
+
+    # Icons are stored as .npy files keyed by the SVG content and target size and
+    # loaded memory-mapped, so a warm start does no rasterization at all.
+    directory = cache_directory("icons")
+
+    with open(path, "rb") as f:
+        key = hashlib.sha1(f.read() + "{:.2f}x{:.2f}".format(width, height).encode()).hexdigest()
+
+    entry = os.path.join(directory, key + ".npy")
+
+    if os.path.exists(entry):
+        try:
+            image = np.load(entry, mmap_mode = "r")
+            os.utime(entry)
+
+            return image
+        except (OSError, ValueError):
+            print(f"Corrupted icon cache entry {entry}, rasterizing again...")
+
+    # Imported here, demo discovery uses this module without the GUI library
+    from opengl_gui.gui_helper import rasterize_svg
+
+    image = np.ascontiguousarray(rasterize_svg(path = path, width = width, height = height), dtype = np.uint8)
+
+    try:
+        temporary = entry + ".tmp"
+        with open(temporary, "wb") as f:
+            np.save(f, image)
+        os.replace(temporary, entry)
+
+        evict(directory, budget)
+    except OSError as e:
+        print(f"Could not write icon cache entry: {e}")
+
+    return image
+
+def video_cache_entry(path: str, width: int, height: int) -> str:
+
+    # Keyed by the source file identity and the display size, without reading the video
+    stat = os.stat(path)
+    key  = hashlib.sha1("{}:{}:{}:{}x{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, width, height).encode()).hexdigest()
+
+    return os.path.join(cache_directory("videos"), key)
+
+def load_cached_video(path: str, width: int, height: int) -> tuple:
+
+    # Returns (frames, fps) for a video transcoded by transcode_video, frames being a
+    # read-only memory map of shape (count, height, width, 3), or None when the video
+    # is not cached yet. The sidecar index is written last, so its presence marks a
+    # complete entry.
+    entry = video_cache_entry(path, width, height)
+
+    try:
+        with open(entry + ".json", "r") as f:
+            index = json.load(f)
+
+        shape  = tuple(index["shape"])
+        frames = np.memmap(entry + ".rgb", dtype = np.uint8, mode = "r", shape = shape)
+
+        os.utime(entry + ".json")
+        os.utime(entry + ".rgb")
+
+        return frames, index["fps"]
+
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.exists(entry + ".json"):
+            print(f"Corrupted video cache entry {entry}: {e}")
+
+    return None
+
+def transcode_video(path: str, width: int, height: int, budget: int = 1024*1024*1024) -> bool:
+
+    # Decodes the whole video once, resized to width x height, into a raw RGB frame file
+    # with a JSON sidecar index. Meant for short looping videos, playback from the cache
+    # is then a page cache read shared by all runs and processes.
+    entry = video_cache_entry(path, width, height)
+    capture = cv2.VideoCapture(path)
+
+    if not capture.isOpened():
+        print(f"Could not open {path} for transcoding...")
+        return False
+
+    fps   = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    count = 0
+
+    frame   = None
+    resized = np.empty((height, width, 3), dtype = np.uint8)
+
+    # Several GUI processes may transcode the same video at once
+    temporary = "{}.{}.tmp".format(entry, os.getpid())
+
+    try:
+        with open(temporary + ".rgb", "wb") as f:
+            while True:
+                ok, frame = capture.read(frame)
+
+                if not ok:
+                    break
+
+                cv2.resize(frame, (width, height), dst = resized, interpolation = cv2.INTER_AREA)
+                cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst = resized)
+
+                f.write(resized.data)
+                count += 1
+
+        capture.release()
+
+        if count == 0:
+            os.remove(temporary + ".rgb")
+            return False
+
+        os.replace(temporary + ".rgb", entry + ".rgb")
+
+        with open(temporary + ".json", "w") as f:
+            json.dump({"source": os.path.abspath(path), "shape": [count, height, width, 3], "fps": fps}, f)
+        os.replace(temporary + ".json", entry + ".json")
+
+        evict(cache_directory("videos"), budget)
+
+    except OSError as e:
+        print(f"Could not write video cache entry: {e}")
+        return False
+
+    print(f"Transcoded {path} into {count} cached frames at {width}x{height}")
+
+    return True
@@ -0,0 +1,179 @@
+import cv2
+import time
+import numpy as np
+
+from threading import Lock
+
+from gui_frames import FrameSlot, FrameDownscaler, FrameBuffers
+
+# Encoded frames are sent as the image of a regular frame message, a 1 x N (or N) uint8
+# array holding the JPEG or PNG file. Raw frames stay the default, senders opt in.
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC  = b"\x89PNG"
+
+def encoded_format(image) -> str:
+
+    # "jpeg", "png" or None for raw frames
+    if image is None or image.dtype != np.uint8 or image.ndim > 2 or (image.ndim == 2 and image.shape[0] != 1):
+        return None
+
+    head = image.reshape(-1)[:4].tobytes()
+
+    if head.startswith(JPEG_MAGIC):
+        return "jpeg"
+    if head.startswith(PNG_MAGIC):
+        return "png"
+
+    return None
+
+def encode_frame(image: np.ndarray, format: str = "jpeg", quality: int = 90) -> np.ndarray:
+
+    # Sender side, RGB image to a 1 x N message image
+    parameters = [cv2.IMWRITE_JPEG_QUALITY, quality] if format == "jpeg" else []
+    ok, data = cv2.imencode("." + ("jpg" if format == "jpeg" else "png"), cv2.cvtColor(image, cv2.COLOR_RGB2BGR), parameters)
+
+    if not ok:
+        raise ValueError(f"Could not encode frame as {format}")
+
+    return data.reshape(1, -1)
+
+class StreamDecoder:
+
+    # Decodes the encoded frames of one stream on a shared thread pool and publishes
+    # them to its FrameSlot, latest wins. At most `in_flight` frames of the stream are
+    # decoded at once, a frame arriving while all are busy replaces the waiting one.
+    # Results are published in arrival order, a decode finishing after a newer frame
+    # was published is dropped.
+    #
+    # Decoded images are converted to RGB into FrameBuffers of the slot, so a buffer
+    # the downscaler leaves as it is is not overwritten while a consumer may still use
+    # it. JPEG frames are decoded at a reduced size (1/2, 1/4, 1/8) when the downscaler
+    # would reduce them at least as much anyway.
+
+    def __init__(self, name: str, slot: FrameSlot, downscaler: FrameDownscaler, pool, in_flight: int = 2):
+
+        self.name = name
+        self.slot = slot
+        self.downscaler = downscaler
+        self.pool = pool
+        self.in_flight = in_flight
+
+        self.lock    = Lock()
+        self.pending = None # (ticket, data, timestamp, received, source) waiting for a worker
+        self.busy    = 0
+        self.ticket  = 0
+        self.published_ticket = 0
+
+        self.buffers   = FrameBuffers(slot)
+        self.full_size = None # Size of the last frame before reduction
+
+        self.metrics = {"received": 0, "decoded": 0, "replaced": 0, "late": 0, "errors": 0,
+                        "decode_last": 0.0, "decode_max": 0.0, "decode_total": 0.0}
+
+    def submit(self, data: np.ndarray, timestamp: float, received: float, source: int = None):
+
+        with self.lock:
+            self.ticket += 1
+            self.metrics["received"] += 1
+
+            if self.pending is not None:
+                self.metrics["replaced"] += 1
+
+            # The echolib buffer may be reused once the callback returns
+            self.pending = (self.ticket, np.array(data, copy = True), timestamp, received, source)
+
+            if self.busy >= self.in_flight:
+                return
+
+            self.busy += 1
+
+        self.pool.submit(self.__work)
+
+    def get_metrics(self) -> dict:
+
+        with self.lock:
+            metrics = dict(self.metrics)
+            metrics["queue_depth"] = self.busy + (1 if self.pending is not None else 0)
+
+        metrics["decode_mean"] = metrics["decode_total"]/metrics["decoded"] if metrics["decoded"] > 0 else 0.0
+
+        return metrics
+
+    def __work(self):
+
+        while True:
+
+            with self.lock:
+                if self.pending is None:
+                    self.busy -= 1
+                    return
+
+                ticket, data, timestamp, received, source = self.pending
+                self.pending = None
+
+            started = time.perf_counter()
+            buffer  = self.__decode(data)
+            elapsed = time.perf_counter() - started
+
+            if buffer is None:
+                with self.lock:
+                    self.metrics["errors"] += 1
+                continue
+
+            # The downscaler sees the reduced image and only reduces it further if needed
+            image = self.downscaler(buffer)
+
+            if image is not buffer:
+                self.buffers.release(buffer)
+
+            with self.lock:
+                self.metrics["decoded"] += 1
+                self.metrics["decode_last"]   = elapsed
+                self.metrics["decode_max"]    = max(self.metrics["decode_max"], elapsed)
+                self.metrics["decode_total"] += elapsed
+
+                if ticket < self.published_ticket:
+                    self.metrics["late"] += 1
+                    self.buffers.release(image)
+                    continue
+
+                # Publishing under the lock keeps frames in arrival order
+                self.published_ticket = ticket
+                self.buffers.publish(image, timestamp, received, source)
+
+    def __reduction(self, data: np.ndarray) -> int:
+
+        target = self.downscaler.target_size
+
+        if encoded_format(data) != "jpeg" or self.full_size is None or target is None or not self.downscaler.enabled or self.downscaler.method == "off":
+            return cv2.IMREAD_COLOR
+
+        step = min(self.full_size[0]//target[0], self.full_size[1]//target[1])
+
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if step >= factor:
+                return flag
+
+        return cv2.IMREAD_COLOR
+
+    def __decode(self, data: np.ndarray) -> np.ndarray:
+
+        flag = self.__reduction(data)
+        bgr  = cv2.imdecode(data.reshape(-1), flag)
+
+        if bgr is None:
+            print(f"Could not decode frame of {self.name}")
+            return None
+
+        if bgr.ndim == 2:
+            bgr = cv2.cvtColor(bgr, cv2.COLOR_GRAY2BGR)
+
+        factor = {cv2.IMREAD_REDUCED_COLOR_2: 2, cv2.IMREAD_REDUCED_COLOR_4: 4, cv2.IMREAD_REDUCED_COLOR_8: 8}.get(flag, 1)
+
+        with self.lock:
+            self.full_size = (bgr.shape[1]*factor, bgr.shape[0]*factor)
+
+        buffer = self.buffers.take(bgr.shape)
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst = buffer)
+
+        return buffer
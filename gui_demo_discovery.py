@@ -0,0 +1,219 @@
+import xml.etree.ElementTree as ET
+import os
+import sys
+import json
+import hashlib
+
+from threading import Lock
+from importlib import import_module, reload
+
+from gui_cache import cache_directory
+
+# Demo discovery, the demos directory and its cfg.xml files to demo records. Kept free
+# of opengl_gui, so tools without the GUI library (benchmark --no-gl) can list demos.
+
+def empty_scene(parameters) -> dict:
+
+    return {"get_docker_texture": lambda gui, state: None, "elements": []}
+
+class LazyScene():
+
+    # Stands in for a demo's get_scene. The scene module is imported on the first call
+    # (or by prefetch), so discovery only has to read cfg.xml. A module that fails to
+    # import, a half saved scene.py for example, is reported and the get_scene of the
+    # previous version is used, or an empty scene if there is none.
+
+    def __init__(self, module_path: str, reload: bool = False, previous = None):
+
+        self.module_path = module_path
+        self.get_scene   = None
+        self.reload      = reload
+        self.previous    = previous
+        self.lock        = Lock()
+
+    def prefetch(self):
+
+        with self.lock:
+            if self.get_scene is not None:
+                return
+
+            try:
+                # A changed scene.py is re-imported in place when the demos directory is watched
+                if self.reload and self.module_path in sys.modules:
+                    module = reload(sys.modules[self.module_path])
+                else:
+                    module = import_module(self.module_path)
+
+            except Exception as e:
+                print("Could not import {}: {}".format(self.module_path, repr(e)))
+                self.get_scene = self.previous if self.previous is not None else empty_scene
+                return
+
+            if hasattr(module, "get_scene"):
+                self.get_scene = module.get_scene
+            else:
+                # TODO better error reporting
+                print("{} is not valid.".format(self.module_path))
+                self.get_scene = empty_scene
+
+    def __call__(self, parameters) -> dict:
+
+        self.prefetch()
+
+        return self.get_scene(parameters)
+
+def parse_demo(root: str, demo_name: str) -> dict:
+
+    # Validated record of one demo directory, None if it is not a valid demo
+    demo_root = root + "/" + demo_name
+    demo_has_cfg = False
+    demo_has_scene = False
+
+    if not os.path.isdir(demo_root):
+        return None
+
+    for demo_files in os.listdir(demo_root):
+        demo_has_cfg = demo_has_cfg or demo_files == "cfg.xml"
+        demo_has_scene = demo_has_scene or demo_files == "scene.py"
+
+    if not (demo_has_cfg and demo_has_scene):
+        return None
+
+    module_path = "demos." + demo_name + "." + "scene"
+
+    xml_valid = [False, False, False, False]
+
+    xml_path = demo_root + "/cfg.xml"
+
+    # A half saved cfg.xml is parsed again once its modification time changes
+    try:
+        xml_tree = ET.parse(xml_path)
+    except ET.ParseError as e:
+        print("{} is not valid: {}".format(xml_path, e))
+        return None
+
+    xml_cfg_root = xml_tree.getroot()
+    xml_parsed = {}
+
+    if xml_cfg_root.tag == "cfg":
+        for xml_c in list(xml_cfg_root): # Iterator for children
+            if xml_c.tag == "demoId":
+                xml_parsed[xml_c.tag] = xml_c.text
+                xml_valid[0] = True
+            elif xml_c.tag == "dockerId":
+                xml_parsed[xml_c.tag] = xml_c.text
+                xml_valid[1] = True
+            elif xml_c.tag == "highlight":
+                xml_parsed[xml_c.tag] = xml_c.text
+                xml_valid[2] = True
+            elif xml_c.tag == "video":
+                xml_parsed[xml_c.tag] = demo_root + "/" + xml_c.text
+                xml_valid[3] = True
+
+    if not all(xml_valid):
+        # TODO better error reporting
+        print("{} is not valid.".format(module_path))
+        return None
+
+    return {"cfg": xml_parsed, "module": module_path}
+
+def demo_mtimes(root: str, demo_name: str) -> list:
+
+    mtimes = []
+    for path in [root + "/" + demo_name, root + "/" + demo_name + "/cfg.xml", root + "/" + demo_name + "/scene.py"]:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+
+    return mtimes
+
+def load_demos(root: str = "./demos") -> dict:
+
+    # Demo records are kept in a manifest together with the modification times of the
+    # demo directory, cfg.xml and scene.py. Only demos whose times changed are parsed
+    # again, and the demos directory is only listed when its own time changed.
+    manifest_path = os.path.join(cache_directory("manifest"), hashlib.sha1(os.path.abspath(root).encode()).hexdigest() + ".json")
+
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {"root_mtime": None, "demos": {}}
+
+    root_mtime = os.stat(root).st_mtime_ns
+    names = manifest["demos"].keys() if manifest["root_mtime"] == root_mtime else os.listdir(root)
+
+    entries = {}
+    changed = manifest["root_mtime"] != root_mtime
+
+    for demo_name in names:
+
+        mtimes = demo_mtimes(root, demo_name)
+        cached = manifest["demos"].get(demo_name)
+
+        if cached is not None and cached["mtimes"] == mtimes:
+            entries[demo_name] = cached
+        else:
+            entries[demo_name] = {"mtimes": mtimes, "record": parse_demo(root, demo_name)}
+            changed = True
+
+    if changed:
+        try:
+            temporary = manifest_path + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump({"root_mtime": root_mtime, "demos": entries}, f)
+            os.replace(temporary, manifest_path)
+        except OSError as e:
+            print(f"Could not write demo manifest: {e}")
+
+    demos = {}
+
+    for demo_name in sorted(entries.keys()):
+
+        record = entries[demo_name]["record"]
+
+        if record is None:
+            continue
+
+        if record["cfg"]["demoId"] in demos.keys():
+            print("Duplicated demo id -> {}".format(record["cfg"]["demoId"]))
+        else:
+            # The scene module is imported when the demo is first started
+            demos[record["cfg"]["demoId"]] = {"cfg": record["cfg"], "get_scene": LazyScene(record["module"])}
+
+    return dict(sorted(demos.items(), key = lambda x: x[1]["cfg"]["highlight"]))
+
+def module_directory(module_path: str) -> str:
+
+    return module_path.split(".")[1]
+
+def reload_demos(demos: dict, changed: set, root: str = "./demos") -> tuple:
+
+    # Discovers the demos again and keeps the entries of demos whose directory is not
+    # in changed, so their imported scenes stay untouched. Returns the new demos and
+    # the ids of demos that were added, removed or changed.
+    reloaded = load_demos(root)
+    affected = set()
+
+    for demo_id in reloaded:
+
+        if demo_id not in demos:
+            affected.add(demo_id)
+            continue
+
+        old = demos[demo_id]
+        new = reloaded[demo_id]
+
+        if old["cfg"] == new["cfg"] and old["get_scene"].module_path == new["get_scene"].module_path and module_directory(new["get_scene"].module_path) not in changed:
+            reloaded[demo_id] = old
+        else:
+            new["get_scene"].reload   = True
+            new["get_scene"].previous = old["get_scene"].get_scene
+            affected.add(demo_id)
+
+    for demo_id in demos:
+        if demo_id not in reloaded:
+            affected.add(demo_id)
+
+    return reloaded, affected
@@ -0,0 +1,165 @@
+import os
+import time
+import ctypes
+import struct
+
+from threading import Thread, Lock
+
+from opengl_gui.gui_components import *
+from opengl_gui.gui_helper     import *
+
+from gui_demo_discovery import empty_scene, LazyScene, parse_demo, demo_mtimes, load_demos, module_directory, reload_demos
+
+class LazyVideos():
+
+    # Demo preview videos by demo id, opened on first access. video_type is Video or a
+    # class with the same interface, such as gui_video.ThreadedVideo.
+
+    def __init__(self, demos: dict, video_type = Video):
+
+        self.demos  = demos
+        self.videos = {}
+        self.lock   = Lock()
+        self.video_type = video_type
+
+    def __getitem__(self, demo_id: str) -> Video:
+
+        with self.lock:
+            if demo_id not in self.videos:
+                self.videos[demo_id] = self.video_type(path = self.demos[demo_id]["cfg"]["video"], loop = True)
+
+            return self.videos[demo_id]
+
+    def forget(self, demo_id: str):
+
+        with self.lock:
+            self.videos.pop(demo_id, None)
+
+def prefetch_demos(demos: dict, videos: LazyVideos):
+
+    # Imports all scene modules and opens all preview videos on a background thread
+    def prefetch():
+        for d in demos:
+            demos[d]["get_scene"].prefetch()
+            videos[d]
+
+    Thread(target = prefetch, daemon = True).start()
+
+class DemoWatcher():
+
+    # Watches the demos directory with inotify and collects the names of demo
+    # directories in which something changed. Falls back to polling modification
+    # times where inotify is not available. on_change is called from the watcher
+    # thread, changes() returns them on the render thread once they settled.
+
+    IN_ATTRIB, IN_CLOSE_WRITE = 0x004, 0x008
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x040, 0x080, 0x100, 0x200
+    IN_DELETE_SELF, IN_ISDIR = 0x400, 0x40000000
+
+    MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+    def __init__(self, root: str = "./demos", on_change = None, settle: float = 0.3):
+
+        self.root      = root
+        self.on_change = on_change
+        self.settle    = settle
+
+        self.lock    = Lock()
+        self.changed = set()
+        self.last_event = 0.0
+
+        self.watches = {}
+
+        try:
+            self.libc = ctypes.CDLL("libc.so.6", use_errno = True)
+            self.fd   = self.libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            self.fd = -1
+
+        if self.fd >= 0:
+            self.__watch(None)
+            for demo_name in os.listdir(root):
+                self.__watch(demo_name)
+
+            Thread(target = self.__read_events, daemon = True).start()
+        else:
+            print("inotify is not available, polling the demos directory...")
+            Thread(target = self.__poll, daemon = True).start()
+
+    def changes(self) -> set:
+
+        with self.lock:
+            if len(self.changed) == 0 or time.time() - self.last_event < self.settle:
+                return set()
+
+            changed, self.changed = self.changed, set()
+
+        return changed
+
+    def __notify(self, demo_name: str):
+
+        with self.lock:
+            self.changed.add(demo_name)
+            self.last_event = time.time()
+
+        if self.on_change is not None:
+            self.on_change()
+
+    def __watch(self, demo_name: str):
+
+        path = self.root if demo_name is None else self.root + "/" + demo_name
+
+        if not os.path.isdir(path) or (demo_name is not None and demo_name.startswith((".", "__"))):
+            return
+
+        wd = self.libc.inotify_add_watch(self.fd, path.encode(), self.MASK)
+        if wd >= 0:
+            self.watches[wd] = demo_name
+
+    def __read_events(self):
+
+        header = struct.calcsize("iIII")
+
+        while True:
+            data = os.read(self.fd, 64*1024)
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+                name = data[offset + header: offset + header + length].rstrip(b"\0").decode()
+                offset += header + length
+
+                if name.startswith((".", "__")) or name.endswith(".pyc"):
+                    continue
+
+                demo_name = self.watches.get(wd)
+
+                if demo_name is None:
+                    # Event in the demos directory itself, a demo was added or removed
+                    if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        self.__watch(name)
+                    if name != "":
+                        self.__notify(name)
+                elif mask & self.IN_DELETE_SELF:
+                    self.watches.pop(wd, None)
+                    self.__notify(demo_name)
+                elif name in ("cfg.xml", "scene.py") or mask & (self.IN_CREATE | self.IN_DELETE | self.IN_MOVED_FROM | self.IN_MOVED_TO):
+                    self.__notify(demo_name)
+
+    def __poll(self):
+
+        mtimes = {}
+
+        while True:
+            current = {}
+            for demo_name in os.listdir(self.root):
+                if not demo_name.startswith((".", "__")):
+                    current[demo_name] = demo_mtimes(self.root, demo_name)
+
+            if len(mtimes) > 0:
+                for demo_name in set(current.keys()) | set(mtimes.keys()):
+                    if current.get(demo_name) != mtimes.get(demo_name):
+                        self.__notify(demo_name)
+
+            mtimes = current
+            time.sleep(1.0)
@@ -0,0 +1,70 @@
+import json
+import time
+
+from collections import namedtuple
+
+# Detection results sent by demo containers instead of annotated frames, as a JSON string
+# on DETECTION_CHANNEL:
+#
+#   {"sequence": 1234, "timestamp": 1690000000.0, "width": 4024, "height": 3036,
+#    "boxes":    [{"box": [x0, y0, x1, y1], "label": "board", "score": 0.93}],
+#    "polygons": [{"points": [[x, y], ...], "label": "tile", "score": 0.81}],
+#    "counts":   {"tile": 12}}
+#
+# sequence and timestamp identify the camera frame the detections were computed on,
+# the sequence number and capture time from its frame header. The overlay matches
+# detections to the frame on screen by sequence, by timestamp if there is none. Coordinates are pixels of a
+# width x height frame, or normalized to [0, 1] when width and height are left out.
+
+DETECTION_CHANNEL = "docker_demo_detections"
+
+Detections = namedtuple("Detections", ["sequence", "timestamp", "received", "boxes", "polygons", "counts"])
+
+def parse_detections(text: str) -> Detections:
+
+    # Boxes and polygons are normalized to [0, 1], returns None for malformed messages.
+    # Runs in the echolib callback, so nothing a container sends may raise from here,
+    # and the overlay gets labels, scores and counts it can format.
+    try:
+        message = json.loads(text)
+
+        if not isinstance(message, dict):
+            raise ValueError("not a JSON object")
+
+        width  = float(message.get("width", 1.0))
+        height = float(message.get("height", 1.0))
+
+        if not (width > 0.0 and height > 0.0):
+            raise ValueError(f"frame size {width} x {height}")
+
+        def caption(d):
+            label = d.get("label")
+            score = d.get("score")
+            return None if label is None else str(label), None if score is None else float(score)
+
+        boxes = []
+        for b in message.get("boxes", []):
+            x0, y0, x1, y1 = (float(v) for v in b["box"])
+            boxes.append(((x0/width, y0/height, x1/width, y1/height), *caption(b)))
+
+        polygons = []
+        for p in message.get("polygons", []):
+            polygons.append(([(float(x)/width, float(y)/height) for x, y in p["points"]], *caption(p)))
+
+        counts = message.get("counts", {})
+
+        if not isinstance(counts, dict):
+            raise ValueError("counts is not a JSON object")
+
+        sequence  = message.get("sequence")
+        timestamp = message.get("timestamp")
+
+        sequence  = None if sequence  is None else int(sequence)
+        timestamp = None if timestamp is None else float(timestamp)
+
+        return Detections(sequence, timestamp, time.time(), boxes, polygons, counts)
+
+    except (ValueError, KeyError, TypeError, AttributeError, ZeroDivisionError, OverflowError) as e:
+        print(f"Malformed detection message: {e}")
+
+    return None
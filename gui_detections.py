@@ -0,0 +1,182 @@
+import time
+
+from opengl_gui.gui_components import *
+
+from gui_detection_messages import Detections
+
+class DetectionOverlay(Container):
+
+    # Transparent container over the demo display that draws the latest detections of
+    # the handler's detection slot on top of the live camera texture. Boxes are drawn as
+    # four thin containers. opengl_gui has no rotated elements, so polygon edges are
+    # approximated by dotted lines of small square markers, with a larger marker on
+    # every vertex. Labels and counts are text fields. Elements come from pools that
+    # are laid out again only when new detections arrive or they go stale, at most
+    # max_markers line and marker elements are used.
+    #
+    # Detections belong to the camera frame with their sequence number. They are hidden
+    # once the camera frame on screen is more than max_frames frames past it. Without
+    # sequence numbers on either side, they are hidden once the frame on screen was
+    # captured more than max_age seconds after theirs. Either way they are hidden
+    # max_age seconds after they arrived.
+
+    def __init__(self, echolib_handler, font: dict, aspect_ratio: float, max_age: float = 0.5, max_frames: int = 3,
+                 colour: list = [226.0/255, 61.0/255, 40.0/255.0, 0.9], line_width: float = 0.003,
+                 max_labels: int = 16, max_markers: int = 1024, id: str = "detection_overlay"):
+
+        super().__init__(position = [0.0, 0.0], scale = [1.0, 1.0], depth = 0.93, colour = [0.0, 0.0, 0.0, 0.0], id = id)
+
+        self.handler = echolib_handler
+        self.font    = font
+        self.aspect_ratio = aspect_ratio
+        self.max_age = max_age
+        self.max_frames  = max_frames
+        self.max_markers = max_markers
+        self.line_colour = colour
+        self.line_width  = line_width
+        self.max_labels  = max_labels
+
+        self.lines  = []
+        self.labels = []
+
+        self.shown_sequence = 0
+        self.visible = False
+
+    def set_aspect(self, aspect_ratio: float):
+
+        # Labels are created again for the new aspect on the next draw
+        self.aspect_ratio = aspect_ratio
+        self.labels = []
+        self.shown_sequence = -1
+
+    def receiving(self) -> bool:
+
+        # True while a container sends detections, scenes keep the camera live then
+        frame = self.handler.detection_slot.latest()
+
+        return frame.image is not None and time.time() - frame.image.received < max(self.max_age, 1.0)
+
+    def execute(self, parent, gui, custom_data):
+
+        frame = self.handler.detection_slot.latest()
+        stale = frame.image is None or self.__stale(frame.image)
+
+        if frame.sequence != self.shown_sequence or (self.visible and stale):
+            self.shown_sequence = frame.sequence
+            self.visible = not stale
+
+            self.__layout(frame.image if self.visible else None, parent)
+
+        if self.visible:
+            super().execute(parent = parent, gui = gui, custom_data = custom_data)
+
+    def __stale(self, detections: Detections) -> bool:
+
+        if time.time() - detections.received > self.max_age:
+            return True
+
+        camera = self.handler.get_camera_frame()
+
+        if detections.sequence is not None and camera.source is not None:
+            return camera.source - detections.sequence > self.max_frames
+
+        return detections.timestamp is not None and camera.timestamp - detections.timestamp > self.max_age
+
+    def __line(self, index: int) -> Container:
+
+        while len(self.lines) <= index:
+            self.lines.append(Container(
+                position = [0.0, 0.0],
+                scale  = [0.0, 0.0],
+                depth  = 0.92,
+                colour = self.line_colour,
+                id = f"{self.id}_line_{len(self.lines)}"))
+
+        return self.lines[index]
+
+    def __label(self, index: int) -> TextField:
+
+        while len(self.labels) <= index:
+            self.labels.append(TextField(
+                position = [0.0, 0.0],
+                text_scale = 0.45,
+                depth  = 0.91,
+                colour = [1.0, 1.0, 1.0, 0.9],
+                aspect_ratio = self.aspect_ratio,
+                id = f"{self.id}_label_{len(self.labels)}"))
+
+        return self.labels[index]
+
+    def __layout(self, detections: Detections, parent):
+
+        self.dependent_components.clear()
+
+        if detections is None:
+            return
+
+        w = self.line_width
+        lines  = 0
+        labels = []
+
+        def rectangle(x0, y0, x1, y1):
+            nonlocal lines
+            if lines + 4 > self.max_markers:
+                return
+            for position, scale in (([x0, y0], [x1 - x0, w]), ([x0, y1 - w], [x1 - x0, w]), ([x0, y0], [w, y1 - y0]), ([x1 - w, y0], [w, y1 - y0])):
+                line = self.__line(lines)
+                line.position = position
+                line.scale    = scale
+                line.depends_on(element = self)
+                lines += 1
+
+        def caption(label, score):
+            if label is None:
+                return None
+            return label if score is None else "{} {:.2f}".format(label, score)
+
+        for (x0, y0, x1, y1), label, score in detections.boxes:
+            rectangle(x0, y0, x1, y1)
+            labels.append(([x0, max(0.0, y0 - 0.03)], caption(label, score)))
+
+        def marker(x, y, size):
+            nonlocal lines
+            if lines >= self.max_markers:
+                return
+            line = self.__line(lines)
+            line.position = [x - size/2, y - size/2]
+            line.scale    = [size, size]
+            line.depends_on(element = self)
+            lines += 1
+
+        for points, label, score in detections.polygons:
+
+            if len(points) == 0:
+                continue
+
+            # Edges as dots spaced three line widths apart
+            for (xa, ya), (xb, yb) in zip(points, points[1:] + points[:1]):
+                steps = max(1, int(max(abs(xb - xa), abs(yb - ya))/(3*w)))
+                for k in range(min(steps, self.max_markers - lines)):
+                    marker(xa + (xb - xa)*k/steps, ya + (yb - ya)*k/steps, w)
+
+            for x, y in points:
+                marker(x, y, 4*w)
+
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+
+            labels.append(([min(xs), max(0.0, min(ys) - 0.03)], caption(label, score)))
+
+        if len(detections.counts) > 0:
+            labels.append(([0.02, 0.02], ", ".join("{}: {}".format(k, v) for k, v in detections.counts.items())))
+
+        labels = [l for l in labels if l[1] is not None][:self.max_labels]
+
+        for i, (position, text) in enumerate(labels):
+            field = self.__label(i)
+            field.position = position
+            field.set_text(font = self.font, text = text)
+            field.depends_on(element = self)
+
+        if parent is not None:
+            self.update_geometry(parent = parent)
@@ -1,4 +1,6 @@
-from threading import Thread, Lock
+from threading import Thread, Condition
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import echolib
 from echolib.camera import FrameSubscriber
@@ -6,9 +8,15 @@ from echolib.camera import FrameSubscriber
 import time
 import numpy as np
 
+from gui_frames import FrameSlot, FrameView, FrameDownscaler, FrameBuffers, Frame, capture_timestamp, capture_sequence
+from shm_ring   import SharedFrameRing, FRAME_RING_CHANNEL
+from gui_latency import LatencyTracer
+from gui_detection_messages import DETECTION_CHANNEL, parse_detections
+from gui_decode  import StreamDecoder, encoded_format
+
 class EcholibHandler:
 
-    def __init__(self):
+    def __init__(self, downscale_method: str = "stride", frame_ring: str = None, decode_workers: int = 2):
 
         self.loop   = echolib.IOLoop()
         self.client = echolib.Client()
@@ -34,18 +42,56 @@ class EcholibHandler:
 
         self.docker_camera_ranges = None
 
-        self.camera_stream_image_new = False
-        self.camera_stream_image   = None
-        self.camera_stream_counter = 0
+        # Per-stream latency from capture to display, see gui_latency
+        self.latency = LatencyTracer()
+
+        # Frames are exchanged with the render thread through latest-wins slots. The render
+        # thread remembers the sequence numbers it has consumed, nothing is written back.
+        self.camera_slot = FrameSlot(trace = self.latency.stream("camera_stream_0"))
+
+        # Frames are reduced to the on-screen size on the echolib thread, so the render
+        # thread uploads only what can be displayed. See set_frame_target_size.
+        self.camera_downscaler = FrameDownscaler(downscale_method)
+        self.docker_downscaler = FrameDownscaler(downscale_method)
 
         ###########################
 
-        self.docker_image_new = False
-        self.docker_image     = None
+        self.docker_slot = FrameSlot(trace = self.latency.stream("docker_demo_output"))
+
+        # Demo containers may hand frames over in the shared memory ring named frame_ring
+        # and only announce them on echolib. The ring is attached on the first notification
+        # and again when the docker manager re-created it (see shm_ring). Frames are copied
+        # out of the ring, downscaled or into frame_ring_buffers, before being published.
+        self.frame_ring_name = frame_ring
+        self.frame_ring      = None
+        self.frame_ring_sub  = None
+        self.frame_ring_sequence = 0
+        self.frame_ring_buffers  = FrameBuffers(self.docker_slot)
+
+        if frame_ring is not None:
+            self.frame_ring_sub = echolib.Subscriber(self.client, FRAME_RING_CHANNEL, "string", self.__callback_shared_frame)
+
+        # Frames sent JPEG or PNG encoded are recognized by their magic bytes and decoded
+        # on this pool, raw frames take the usual path. See gui_decode.
+        self.decode_pool = ThreadPoolExecutor(max_workers = decode_workers) if decode_workers > 0 else None
+
+        if self.decode_pool is not None:
+            self.camera_decoder = StreamDecoder("camera_stream_0",    self.camera_slot, self.camera_downscaler, self.decode_pool, in_flight = decode_workers)
+            self.docker_decoder = StreamDecoder("docker_demo_output", self.docker_slot, self.docker_downscaler, self.decode_pool, in_flight = decode_workers)
+
+        # Containers may send detections instead of annotated frames, the slot holds the
+        # latest gui_detection_messages.Detections, drawn by a DetectionOverlay over the camera
+        self.detection_slot = FrameSlot()
+        self.detection_sub  = echolib.Subscriber(self.client, DETECTION_CHANNEL, "string", self.__callback_detections)
+
+        # Commands are queued by the render thread and sent by the dispatch thread, which
+        # sleeps on commands_condition until something is queued. Entries carry their
+        # enqueue time for the latency counters in command_metrics.
+        self.commands_condition = Condition()
+        self.docker_commands = deque()
+        self.camera_commands = deque()
 
-        self.commands_lock = Lock()
-        self.docker_commands = []
-        self.camera_commands = []
+        self.command_metrics = {"sent": 0, "latency_last": 0.0, "latency_max": 0.0, "latency_total": 0.0}
 
         self.docker_channel_in  = None
         self.docker_channel_out = None
@@ -59,30 +105,47 @@ class EcholibHandler:
         self.handler_thread = Thread(target = self.run)
         self.handler_thread.start()
 
+        self.dispatch_thread = Thread(target = self.dispatch)
+        self.dispatch_thread.start()
+
         self.n_ready = 0
 
     def run(self):
-        
+
+        # Only services echolib IO, loop.wait blocks until messages arrive or it times out
         while self.loop.wait(10) and self.running:
-	    
-            self.commands_lock.acquire()
-            if len(self.docker_commands) > 0:
-                
-                command = self.docker_commands.pop(0)
+            pass
+
+    def dispatch(self):
+
+        while self.running:
+
+            with self.commands_condition:
+                while len(self.docker_commands) == 0 and len(self.camera_commands) == 0 and self.running:
+                    self.commands_condition.wait(0.1)
+
+                docker_command = self.docker_commands.popleft() if len(self.docker_commands) > 0 else None
+                camera_command = self.camera_commands.popleft() if len(self.camera_commands) > 0 else None
 
-                print(f"Processing docker command -> {command[1]}")
+            # Sending happens outside of the lock so the render thread never waits on IO
+            if docker_command is not None:
+
+                (publisher, command), enqueued = docker_command
+
+                print(f"Processing docker command -> {command}")
                 
                 writer = echolib.MessageWriter()
-                if type(command[1]) is str:
-                    writer.writeString(command[1])
-                elif type(command[1]) is int:
-                    writer.writeInt(command[1])
+                if type(command) is str:
+                    writer.writeString(command)
+                elif type(command) is int:
+                    writer.writeInt(command)
 
-                command[0].send(writer)
+                publisher.send(writer)
+                self.__record_latency(enqueued)
 
-            if len(self.camera_commands) > 0:
-                
-                command = self.camera_commands.pop(0)
+            if camera_command is not None:
+
+                command, enqueued = camera_command
 
                 print(f"Processing camera command -> {command}")
                 
@@ -90,50 +153,156 @@ class EcholibHandler:
                 writer.writeString(command)
     
                 self.camera_stream_input.send(writer)
-        
-            self.commands_lock.release() 
-            time.sleep(0.01)
+                self.__record_latency(enqueued)
+
+    def close(self):
+
+        self.running = False
+
+        with self.commands_condition:
+            self.commands_condition.notify_all()
+
+        self.handler_thread.join()
+        self.dispatch_thread.join()
+
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+
+        if self.decode_pool is not None:
+            self.decode_pool.shutdown(wait = True)
             
     def append_command(self, command):
 
-        self.commands_lock.acquire()
-        self.docker_commands.append(command)
-        self.commands_lock.release()
+        with self.commands_condition:
+            self.docker_commands.append((command, time.time()))
+            self.commands_condition.notify()
 
     def append_camera_command(self, command):
 
-        self.commands_lock.acquire()
-        self.camera_commands.append(command)
-        self.commands_lock.release()
+        with self.commands_condition:
+            self.camera_commands.append((command, time.time()))
+            self.commands_condition.notify()
+
+    def get_command_metrics(self) -> dict:
+
+        with self.commands_condition:
+            metrics = dict(self.command_metrics)
+            metrics["docker_queue_depth"] = len(self.docker_commands)
+            metrics["camera_queue_depth"] = len(self.camera_commands)
+
+        metrics["latency_mean"] = metrics["latency_total"]/metrics["sent"] if metrics["sent"] > 0 else 0.0
+
+        return metrics
+
+    def get_decode_metrics(self) -> dict:
+
+        # Decode times and queue depths of encoded frames per stream, empty without a pool
+        if self.decode_pool is None:
+            return {}
+
+        return {"camera_stream_0": self.camera_decoder.get_metrics(), "docker_demo_output": self.docker_decoder.get_metrics()}
+
+    def get_latency_statistics(self) -> dict:
+
+        # Rolling p50/p95/p99 frame latencies in milliseconds per stream and segment
+        return self.latency.statistics()
+
+    def __record_latency(self, enqueued):
+
+        latency = time.time() - enqueued
+
+        with self.commands_condition:
+            m = self.command_metrics
+            m["sent"] += 1
+            m["latency_last"]   = latency
+            m["latency_max"]    = max(m["latency_max"], latency)
+            m["latency_total"] += latency
 
     ###########################
 
-    def get_image(self):
+    def camera_view(self) -> FrameView:
 
-        image = self.docker_image if self.docker_image_new else None
-        self.docker_image_new = False
+        return FrameView(self.camera_slot)
 
-        return image
+    def docker_view(self) -> FrameView:
 
-    def set_camera_to_none(self):
-        
-        self.camera_stream_image = None
+        # Frames published before the view was created belong to a previous demo
+        return FrameView(self.docker_slot, skip_current = True)
 
-    def get_camera_stream(self):
-        
-        image = self.camera_stream_image
+    def set_frame_target_size(self, width: int, height: int):
 
-        return image
+        self.camera_downscaler.set_target_size(width, height)
+        self.docker_downscaler.set_target_size(width, height)
+
+    def get_camera_frame(self) -> Frame:
+
+        return self.camera_slot.latest()
 
     ###########################
 
     def __callback_image(self, message):
-        
-        self.docker_image = message.image
-        self.docker_image_new = True
+
+        received = time.time()
+
+        if self.decode_pool is not None and encoded_format(message.image) is not None:
+            self.docker_decoder.submit(message.image, capture_timestamp(message), received)
+            return
+
+        self.docker_slot.publish(self.docker_downscaler(message.image), capture_timestamp(message), received)
 
         print("Got demo containter output!")
 
+    def __callback_shared_frame(self, message):
+
+        received = time.time()
+        sequence, slot = [int(t) for t in echolib.MessageReader(message).readString().split(" ")]
+
+        # A sequence going back means the writer started over, possibly in a new segment
+        restarted = sequence <= self.frame_ring_sequence
+        self.frame_ring_sequence = sequence
+
+        if self.frame_ring is not None and restarted and self.frame_ring.replaced():
+            print(f"Frame ring {self.frame_ring_name} was created again, attaching...")
+            self.frame_ring.close()
+            self.frame_ring = None
+
+        if self.frame_ring is None:
+            try:
+                self.frame_ring = SharedFrameRing.attach(self.frame_ring_name)
+            except (OSError, ValueError) as e:
+                print(f"Could not attach frame ring {self.frame_ring_name}: {e}")
+                return
+
+        shared = self.frame_ring.read(sequence, slot)
+
+        if shared is None:
+            # Overwritten before this notification was handled, a newer one is on its way
+            return
+
+        view, timestamp = shared
+
+        # The writer may come around the ring while the frame is in use, so it is copied
+        # out first. Downscaling already produces a copy.
+        image = self.docker_downscaler(view)
+
+        if image is view:
+            image = self.frame_ring_buffers.take(view.shape)
+            np.copyto(image, view)
+
+        if not self.frame_ring.valid(sequence, slot):
+            # Torn, the writer started on the slot again while it was copied
+            self.frame_ring_buffers.release(image)
+            return
+
+        self.frame_ring_buffers.publish(image, timestamp, received)
+
+    def __callback_detections(self, message):
+
+        detections = parse_detections(echolib.MessageReader(message).readString())
+
+        if detections is not None:
+            self.detection_slot.publish(detections, detections.timestamp)
+
     def __callback_ready(self, message):
 
         # TODO Perhaps doing this in a thread unsafe way? Might not matter
@@ -146,12 +315,15 @@ class EcholibHandler:
 
     def __callback_camera_stream(self, message):
 
-        print(f"Got image...{self.camera_stream_counter}")
-        
-        self.camera_stream_counter += 1
-        self.camera_stream_image = message.image
+        received = time.time()
+
+        if self.decode_pool is not None and encoded_format(message.image) is not None:
+            self.camera_decoder.submit(message.image, capture_timestamp(message), received, capture_sequence(message))
+            return
+
+        frame = self.camera_slot.publish(self.camera_downscaler(message.image), capture_timestamp(message), received, capture_sequence(message))
 
-        self.camera_stream_image_new = True
+        print(f"Got image...{frame.sequence}")
 
     def __callback_camera_stream_output(self, message):
 
@@ -174,5 +346,5 @@ class EcholibHandler:
         
         print(f"Container {stopped_container} stopped...")
 
-        self.docker_image = None
-        self.docker_image_new = False
\ No newline at end of file
+        self.docker_slot.clear()
+        self.detection_slot.clear()
\ No newline at end of file
@@ -0,0 +1,316 @@
+import time
+import numpy as np
+
+from collections import namedtuple
+from threading   import Lock, local, current_thread, main_thread
+
+# A published frame. Frames are never modified after they are published,
+# image may be None when the stream has been cleared. sequence counts the frames
+# of the slot, source is the sequence number the publisher gave the frame, if any.
+Frame = namedtuple("Frame", ["image", "sequence", "timestamp", "source"], defaults = (None,))
+
+class FrameSlot:
+
+    # Latest-wins frame slot shared between its writers (the echolib thread and the
+    # decode pool) and the render thread.
+    #
+    # Publishing stores a new immutable Frame with a single reference assignment,
+    # which is atomic in CPython, so readers never take a lock and never see an
+    # image paired with the wrong sequence number. Writers take a lock, so two of
+    # them never publish frames with the same sequence number. This gives the triple
+    # buffer behaviour without copying pixels: at most three images are alive per
+    # slot, the one being received into, the published one and the one the render
+    # thread is still holding.
+
+    def __init__(self, trace = None):
+
+        self.frame = Frame(None, 0, 0.0)
+        self.lock  = Lock()
+        self.listeners = []
+
+        # When the render thread last read the slot, the render scheduler only redraws
+        # for new frames while something on screen reads them
+        self.last_read = 0.0
+
+        # Optional gui_latency.StreamTrace, timestamps frames at publish and upload
+        self.trace = trace
+
+    def add_listener(self, callback):
+
+        # Called with each published frame on the writer thread, must return quickly.
+        # The list is replaced instead of modified, so publish() never iterates over a
+        # list another thread is changing.
+        self.listeners = self.listeners + [callback]
+
+    def remove_listener(self, callback):
+
+        self.listeners = [c for c in self.listeners if c is not callback]
+
+    def notify(self):
+
+        # Calls the listeners with the current frame again, for consumers that want it redrawn
+        frame = self.frame
+
+        for callback in self.listeners:
+            callback(frame)
+
+    def publish(self, image, timestamp: float = None, received: float = None, source: int = None) -> Frame:
+
+        # received is when the message arrived, before any processing on the writer thread
+        received = time.time() if received is None else received
+
+        with self.lock:
+            frame = Frame(image, self.frame.sequence + 1, received if timestamp is None else timestamp, source)
+
+            if self.trace is not None and image is not None:
+                self.trace.received(frame.sequence, timestamp, received)
+
+            self.frame = frame
+
+        for callback in self.listeners:
+            callback(frame)
+
+        return frame
+
+    def clear(self):
+
+        self.publish(None)
+
+    def latest(self) -> Frame:
+
+        # The render loop runs on the main thread, texture copier threads do not count
+        if current_thread() is main_thread():
+            self.last_read = time.time()
+
+        return self.frame
+
+    @property
+    def sequence(self) -> int:
+
+        return self.frame.sequence
+
+def capture_timestamp(message) -> float:
+
+    # Capture time from the header of an echolib camera frame, None if the
+    # publisher did not fill it in.
+
+    header = getattr(message, "header", None)
+    timestamp = getattr(header, "timestamp", None)
+
+    if timestamp is None:
+        return None
+
+    if hasattr(timestamp, "timestamp"): # datetime
+        return timestamp.timestamp()
+
+    return float(timestamp)
+
+def capture_sequence(message) -> int:
+
+    # Sequence number from the header of an echolib camera frame, None if the
+    # publisher did not fill it in. Detection results refer to frames by it.
+
+    header = getattr(message, "header", None)
+    sequence = getattr(header, "sequence", None)
+
+    return None if sequence is None else int(sequence)
+
+# Threads that only stage frames for a later texture upload, the texture copiers of
+# gui_texture_stream, collect the upload stamps of the frames FrameView.get returns
+# and hand them to stamp_uploads() once the upload is issued on the render thread.
+deferred_uploads = local()
+
+def defer_uploads():
+
+    deferred_uploads.stamps = []
+
+def take_deferred_uploads() -> list:
+
+    stamps = getattr(deferred_uploads, "stamps", None)
+
+    if not stamps:
+        return []
+
+    deferred_uploads.stamps = []
+
+    return stamps
+
+def stamp_uploads(stamps: list):
+
+    for trace, sequence in stamps:
+        trace.uploaded_frame(sequence)
+
+class FrameView:
+
+    # Per-consumer view of a FrameSlot, one for every texture fed from the slot.
+    # get() returns the image only when the slot holds a frame this consumer has not
+    # returned yet and None ("unchanged") otherwise, so the texture is drawn again
+    # without uploading the same pixels twice.
+
+    def __init__(self, slot: FrameSlot, skip_current: bool = False):
+
+        self.slot = slot
+        self.seen = slot.sequence if skip_current else 0
+
+    def get(self):
+
+        frame = self.slot.latest()
+
+        if frame.sequence == self.seen:
+            return None
+
+        self.seen = frame.sequence
+
+        if self.slot.trace is not None and frame.image is not None:
+            stamps = getattr(deferred_uploads, "stamps", None)
+
+            if stamps is None:
+                self.slot.trace.uploaded_frame(frame.sequence)
+            else:
+                stamps.append((self.slot.trace, frame.sequence))
+
+        return frame.image
+
+    def invalidate(self):
+
+        # The texture was overwritten with something else, next get() returns the current frame again
+        self.seen = -1
+        self.slot.notify()
+
+class FrameBuffers:
+
+    # Preallocated images for writers that copy frames before publishing them to a
+    # FrameSlot. A buffer is handed out again only once the slot has published two
+    # newer frames, so neither the published frame nor the previous one, which a
+    # consumer may still be uploading, is overwritten. Buffers taken but never
+    # published must be given back with release().
+
+    def __init__(self, slot: FrameSlot):
+
+        self.slot = slot
+        self.lock = Lock()
+
+        self.buffers   = []
+        self.sequences = [] # Sequence the buffer was published as, -1 while taken, None while free
+
+    def take(self, shape: tuple) -> np.ndarray:
+
+        with self.lock:
+            index = None
+
+            for i, published in enumerate(self.sequences):
+                if published is None or (published >= 0 and published <= self.slot.sequence - 2):
+                    index = i
+                    break
+
+            if index is None:
+                index = len(self.buffers)
+                self.buffers.append(None)
+                self.sequences.append(None)
+
+            if self.buffers[index] is None or self.buffers[index].shape != shape:
+                self.buffers[index] = np.empty(shape, dtype = np.uint8)
+
+            self.sequences[index] = -1
+
+            return self.buffers[index]
+
+    def publish(self, image: np.ndarray, timestamp: float = None, received: float = None, source: int = None) -> Frame:
+
+        # Publishes a taken buffer, or any other image, to the slot
+        with self.lock:
+            frame = self.slot.publish(image, timestamp, received, source)
+
+            for i, b in enumerate(self.buffers):
+                if b is image:
+                    self.sequences[i] = frame.sequence
+
+        return frame
+
+    def release(self, image: np.ndarray):
+
+        with self.lock:
+            for i, b in enumerate(self.buffers):
+                if b is image:
+                    self.sequences[i] = None
+
+class CalibrationFeed:
+
+    # Serves the two calibration displays from one uploaded camera frame. The original
+    # display uploads it, the zoom display samples the centre of the same texture on the
+    # GPU (see gui_texture_stream.CroppedDisplayTexture). margin_x/margin_y are the
+    # fractions of the frame width and height cut off on each side, so the zoom shows
+    # the same region whether or not the frame was downscaled.
+
+    def __init__(self, slot: FrameSlot, margin_x: float, margin_y: float):
+
+        self.view  = FrameView(slot)
+        self.shape = None
+
+        self.margin_x = margin_x
+        self.margin_y = margin_y
+
+    def get_original(self):
+
+        image = self.view.get()
+
+        if image is not None:
+            self.shape = image.shape
+
+        return image
+
+    def get_crop(self):
+
+        # (x0, y0, x1, y1) of the zoom in the uploaded frame, None before the first frame
+        if self.shape is None:
+            return None
+
+        h, w = self.shape[0], self.shape[1]
+        margin_x = min(int(w*self.margin_x), (w - 1)//2)
+        margin_y = min(int(h*self.margin_y), (h - 1)//2)
+
+        return (margin_x, margin_y, w - margin_x, h - margin_y)
+
+class FrameDownscaler:
+
+    # Reduces incoming frames to about the on-screen size before they are published,
+    # by an integer factor so both methods stay plain numpy slicing and reshaping.
+    # "stride" keeps every n-th pixel, "area" averages n x n blocks, "off" disables it.
+
+    def __init__(self, method: str = "stride"):
+
+        self.method  = method
+        self.enabled = True
+        self.target_size = None
+
+    def set_target_size(self, width: int, height: int):
+
+        self.target_size = (max(1, int(width)), max(1, int(height)))
+
+    def __call__(self, image):
+
+        if image is None or not self.enabled or self.method == "off" or self.target_size is None:
+            return image
+
+        step = min(image.shape[1]//self.target_size[0], image.shape[0]//self.target_size[1])
+
+        if step <= 1:
+            return image
+
+        if self.method == "stride":
+            return np.ascontiguousarray(image[::step, ::step])
+
+        h = (image.shape[0]//step)*step
+        w = (image.shape[1]//step)*step
+
+        # Accumulating the step*step strided sub-images is much faster than summing
+        # over the axes of a reshaped view
+        total = np.zeros((h//step, w//step) + image.shape[2:], dtype = np.uint16 if step*step*255 < 65536 else np.uint32)
+
+        for i in range(step):
+            for j in range(step):
+                total += image[i:h:step, j:w:step]
+
+        total //= step*step
+
+        return total.astype(image.dtype)
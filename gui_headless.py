@@ -0,0 +1,101 @@
+import os
+import cv2
+import glfw
+import numpy as np
+
+from OpenGL.GL import *
+
+def prepare_headless() -> str:
+
+    # Must run before the Gui is created. Later glfw.init() calls return right away
+    # and window hints stay set, so the Gui opens an invisible window whose context
+    # comes from EGL, or from OSMesa on GLFW's null platform when there is no display
+    # at all. Returns a description of the chosen context.
+    has_display = os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")
+    null_platform = not has_display and hasattr(glfw, "PLATFORM_NULL")
+
+    if null_platform:
+        glfw.init_hint(glfw.PLATFORM, glfw.PLATFORM_NULL)
+
+    if not glfw.init():
+        raise RuntimeError("Could not initialize GLFW for headless rendering")
+
+    glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+    glfw.window_hint(glfw.FOCUSED, glfw.FALSE)
+    glfw.window_hint(glfw.CONTEXT_CREATION_API, glfw.OSMESA_CONTEXT_API if null_platform else glfw.EGL_CONTEXT_API)
+
+    return "null platform, OSMesa" if null_platform else "invisible window, EGL"
+
+class OffscreenTarget:
+
+    # Framebuffer object the scene is drawn into instead of the window. read() returns
+    # the last frame as an RGB image with the first row at the top.
+
+    def __init__(self, width: int, height: int):
+
+        self.width  = width
+        self.height = height
+
+        self.framebuffer = glGenFramebuffers(1)
+        self.colour, self.depth = glGenRenderbuffers(2)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self.colour)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.colour)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Offscreen framebuffer is incomplete: {status}")
+
+        self.pixels = np.empty((height, width, 3), dtype = np.uint8)
+
+    def bind(self):
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glViewport(0, 0, self.width, self.height)
+
+    def read(self) -> np.ndarray:
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffer)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE, self.pixels)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, 0)
+
+        return self.pixels[::-1]
+
+    def release(self):
+
+        glDeleteFramebuffers(1, [self.framebuffer])
+        glDeleteRenderbuffers(2, [self.colour, self.depth])
+
+class FrameDumper:
+
+    # Writes every `every`-th frame of an OffscreenTarget to directory as PNG or npy
+    def __init__(self, directory: str, format: str = "png", every: int = 1):
+
+        self.directory = directory
+        self.format    = format.lower()
+        self.every     = max(1, every)
+
+        os.makedirs(directory, exist_ok = True)
+
+    def __call__(self, frame_index: int, target: OffscreenTarget):
+
+        if frame_index % self.every != 0:
+            return
+
+        image = target.read()
+        path  = os.path.join(self.directory, "frame_{:06d}.{}".format(frame_index, self.format))
+
+        if self.format == "npy":
+            np.save(path, image)
+        else:
+            cv2.imwrite(path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
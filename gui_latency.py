@@ -0,0 +1,137 @@
+import time
+import json
+import numpy as np
+
+from threading import Lock
+from collections import deque, OrderedDict
+
+# Latency segments of a frame, between the stages at which it is timestamped.
+# The capture stage comes from the frame header and is missing for some publishers.
+SEGMENTS = ["capture_to_receive", "receive_to_upload", "upload_to_display", "receive_to_display", "capture_to_display"]
+
+class StreamTrace:
+
+    # Timestamps frames of one stream at receive, at texture upload and when the frame
+    # buffer they were drawn into is swapped, and keeps the latencies between those
+    # stages for the last window frames of every segment.
+
+    def __init__(self, name: str, window: int = 1000, pending_limit: int = 64):
+
+        self.name = name
+        self.lock = Lock()
+
+        self.pending  = OrderedDict() # sequence -> [capture, receive], until uploaded
+        self.uploaded = []            # (capture, receive, upload) waiting for the next swap
+        self.pending_limit = pending_limit
+
+        self.samples = {s: deque(maxlen = window) for s in SEGMENTS}
+        self.counts  = {"received": 0, "uploaded": 0, "displayed": 0}
+
+    def received(self, sequence: int, capture: float = None, receive: float = None):
+
+        with self.lock:
+            self.pending[sequence] = (capture, time.time() if receive is None else receive)
+            self.counts["received"] += 1
+
+            # Frames replaced before the render thread picked them up are never uploaded
+            while len(self.pending) > self.pending_limit:
+                self.pending.popitem(last = False)
+
+    def uploaded_frame(self, sequence: int):
+
+        now = time.time()
+
+        with self.lock:
+            stamps = self.pending.pop(sequence, None)
+
+            if stamps is None:
+                # Already uploaded by another view of the same stream
+                return
+
+            # Older frames were skipped in favour of this one
+            while len(self.pending) > 0 and next(iter(self.pending)) < sequence:
+                self.pending.popitem(last = False)
+
+            self.uploaded.append((stamps[0], stamps[1], now))
+            self.counts["uploaded"] += 1
+
+    def displayed(self, now: float = None):
+
+        now = time.time() if now is None else now
+
+        with self.lock:
+            uploaded, self.uploaded = self.uploaded, []
+
+            for capture, receive, upload in uploaded:
+
+                self.samples["receive_to_upload"].append(upload - receive)
+                self.samples["upload_to_display"].append(now - upload)
+                self.samples["receive_to_display"].append(now - receive)
+
+                # A capture time from a skewed clock would only pollute the statistics
+                if capture is not None and 0.0 <= receive - capture < 60.0:
+                    self.samples["capture_to_receive"].append(receive - capture)
+                    self.samples["capture_to_display"].append(now - capture)
+
+            self.counts["displayed"] += len(uploaded)
+
+    def statistics(self) -> dict:
+
+        # Percentiles in milliseconds over the rolling window of each segment
+        with self.lock:
+            samples = {s: np.array(self.samples[s]) for s in SEGMENTS}
+            stats   = dict(self.counts)
+
+        for s in SEGMENTS:
+            if len(samples[s]) == 0:
+                continue
+
+            p50, p95, p99 = np.percentile(samples[s], [50, 95, 99])*1000.0
+            stats[s] = {"p50": p50, "p95": p95, "p99": p99, "max": samples[s].max()*1000.0, "n": len(samples[s])}
+
+        return stats
+
+class LatencyTracer:
+
+    def __init__(self, window: int = 1000):
+
+        self.window  = window
+        self.streams = {}
+
+    def stream(self, name: str) -> StreamTrace:
+
+        if name not in self.streams:
+            self.streams[name] = StreamTrace(name, self.window)
+
+        return self.streams[name]
+
+    def displayed(self):
+
+        # Called right after swap_buffers
+        now = time.time()
+
+        for trace in self.streams.values():
+            trace.displayed(now)
+
+    def statistics(self) -> dict:
+
+        return {name: trace.statistics() for name, trace in self.streams.items()}
+
+    def dump(self, path: str = None):
+
+        stats = self.statistics()
+
+        for name, s in stats.items():
+            print(f"Latency of {name}: received {s['received']}, uploaded {s['uploaded']}, displayed {s['displayed']}")
+
+            for segment in SEGMENTS:
+                if segment in s:
+                    v = s[segment]
+                    print(f"    {segment:20s} p50 {v['p50']:8.2f} ms  p95 {v['p95']:8.2f} ms  p99 {v['p99']:8.2f} ms  max {v['max']:8.2f} ms")
+
+        if path is not None:
+            try:
+                with open(path, "w") as f:
+                    json.dump(stats, f, indent = 4)
+            except OSError as e:
+                print(f"Could not write latency statistics: {e}")
@@ -4,76 +4,143 @@ import numpy as np
 
 import glfw
 
+from threading import Thread
+
 from opengl_gui.gui_components import *
 from opengl_gui.gui_helper     import *
 
 from gui_echolib import EcholibHandler
-
-import xml.etree.ElementTree as ET
-import os
-from importlib import import_module
+from gui_frames  import CalibrationFeed
+from gui_texture_stream import StreamingDisplayTexture, CroppedDisplayTexture
+from gui_scheduler import RenderScheduler
+from gui_cache     import cached_rasterize_svg, load_cached_video, transcode_video
+from gui_demos     import load_demos, reload_demos, LazyVideos, DemoWatcher, prefetch_demos
+from gui_video     import ThreadedVideo, MappedVideo
+from shm_ring      import DEFAULT_RING_NAME
+from gui_profiler  import RenderProfiler, ProfilerHud
+from gui_headless  import prepare_headless, OffscreenTarget, FrameDumper
+
+import argparse
 
 class State():
 
-    def __init__(self):
+    def __init__(self, downscale_method: str = "stride", max_fps: float = 60.0, idle_fps: float = 10.0, frame_ring: str = None, decode_workers: int = 2):
 
-        self.echolib_handler = EcholibHandler()
+        self.echolib_handler = EcholibHandler(downscale_method = downscale_method, frame_ring = frame_ring, decode_workers = decode_workers)
 
-def load_demos(root: str = "./demos") -> dict:
+        self.render_scheduler = RenderScheduler(max_fps = max_fps, idle_fps = idle_fps)
+        self.render_scheduler.watch(self.echolib_handler.camera_slot)
+        self.render_scheduler.watch(self.echolib_handler.docker_slot)
+        self.render_scheduler.watch(self.echolib_handler.detection_slot)
 
-    demos = {}
+        # Keys of the demo and preview video on screen, restored when the scene is rebuilt.
+        # The demo's display element is kept as well, so the demo scene and its state
+        # (detection toggles, hold timers) survive the rebuild.
+        self.active_demo  = None
+        self.active_video = None
+        self.active_demo_display = None
 
-    for demo_name in os.listdir(root):
-        
-        demo_root = root + "/" + demo_name
-        demo_has_cfg = False
-        demo_has_scene = False
-
-        for demo_files in os.listdir(demo_root):
-            demo_has_cfg = demo_has_cfg or demo_files == "cfg.xml"
-            demo_has_scene = demo_has_scene or demo_files == "scene.py"
-
-        if demo_has_cfg and demo_has_scene:
-            module_path = "demos." + demo_name + "." + "scene"
-            module = import_module(module_path)
-
-            xml_valid = [False, False, False, False]
-            scene_valid = hasattr(module, "get_scene")
-
-            xml_path = demo_root + "/cfg.xml"
-            xml_tree = ET.parse(xml_path)
-
-            xml_cfg_root = xml_tree.getroot()
-            xml_parsed = {}
-
-            if xml_cfg_root.tag == "cfg":
-                for xml_c in list(xml_cfg_root): # Iterator for children
-                    if xml_c.tag == "demoId":
-                        xml_parsed[xml_c.tag] = xml_c.text
-                        xml_valid[0] = True
-                    elif xml_c.tag == "dockerId":
-                        xml_parsed[xml_c.tag] = xml_c.text
-                        xml_valid[1] = True
-                    elif xml_c.tag == "highlight":
-                        xml_parsed[xml_c.tag] = xml_c.text
-                        xml_valid[2] = True
-                    elif xml_c.tag == "video":
-                        xml_parsed[xml_c.tag] = demo_root + "/" + xml_c.text
-                        xml_valid[3] = True
-            xml_valid = all(xml_valid)
-                        
-            if xml_valid and scene_valid:
-                if xml_parsed["demoId"] in demos.keys():
-                    print("Duplicated demo id -> {}".format(xml_parsed["demoId"]))
-                else:
-                    demos[xml_parsed["demoId"]] = {"cfg": xml_parsed, "get_scene": module.get_scene}
+class SceneResources():
+
+    # Everything the primary scene needs that is expensive to create: demo discovery,
+    # opened videos and rasterized icons. Loaded once and kept when the scene is
+    # rebuilt for a new window size, only the icons are rasterized again for it.
+
+    def __init__(self, window_width: int, window_height: int, font: dict, prefetch: bool = False, watcher: DemoWatcher = None, background_video: bool = False, cache_intro: bool = False):
+
+        # Only cfg.xml is read here, scene modules and preview videos are loaded on first use
+        self.font  = font
+        self.demos = load_demos()
+
+        # Background decoding keeps video decode off the render thread
+        video_type = ThreadedVideo if background_video else Video
+
+        self.demo_videos = LazyVideos(self.demos, video_type = video_type)
+
+        self.prefetch = prefetch
+        self.prefetched = False
+
+        self.watcher = watcher
+        self.removed_demos = {} # Records of the demos removed by the last reload
+
+        self.icon_size = None
+        self.set_window_size(window_width, window_height)
+
+        self.vicos_intro_video = None
+
+        if cache_intro:
+            # Played from frames decoded once at window size. A missing entry is created
+            # in the background and used from the next start on.
+            cached = load_cached_video("./res/vicos.mp4", window_width, window_height)
+
+            if cached is not None:
+                self.vicos_intro_video = MappedVideo(frames = cached[0], fps = cached[1], loop = False)
             else:
-                # TODO better error reporting
-                print("{} is not valid.".format(module_path))
+                Thread(target = transcode_video, args = ("./res/vicos.mp4", window_width, window_height), daemon = True).start()
+
+        if self.vicos_intro_video is None:
+            self.vicos_intro_video = video_type(path = "./res/vicos.mp4", loop = False)
+
+        self.vicos_intro_video.play()
+
+    def set_window_size(self, window_width: int, window_height: int):
+
+        # Icons are rasterized for the window size, sizes seen before come from the icon cache
+        if self.icon_size == (window_width, window_height):
+            return
+
+        self.icon_size = (window_width, window_height)
+
+        icon_width  = int( window_width*0.1)
+        icon_height = int(window_height*0.1)
+
+        self.video_icon = cached_rasterize_svg(path = "./res/icons/video-solid.svg",          width = icon_width*1.0, height = icon_height*1.0)
+        self.point_icon = cached_rasterize_svg(path = "./res/icons/hand-pointer.svg",         width = icon_width*0.7, height = icon_height*0.7)
+        self.pause_icon = cached_rasterize_svg(path = "./res/icons/pause-circle-regular.svg", width = icon_width*0.7, height = icon_height*0.7)
+        self.play_icon  = cached_rasterize_svg(path = "./res/icons/play-circle-regular.svg",  width = icon_width*0.7, height = icon_height*0.7)
+
+    def prefetch_demos(self):
+
+        if self.prefetch and not self.prefetched:
+            self.prefetched = True
+            prefetch_demos(self.demos, self.demo_videos)
+
+    def reload_changed_demos(self) -> tuple:
+
+        # Applies changes reported by the watcher. Unaffected demos keep their scenes
+        # and videos. Returns the ids of demos that were added, removed or changed, and
+        # of those among them whose drawer buttons change (added, removed, new cfg.xml).
+        # The demos dictionary is updated in place, so the click handlers of the scene
+        # pick up a changed scene module without the scene being rebuilt.
+        if self.watcher is None:
+            return set(), set()
+
+        changed = self.watcher.changes()
 
-    return dict(sorted(demos.items(), key = lambda x: x[1]["cfg"]["highlight"]))
+        if len(changed) == 0:
+            return set(), set()
 
-def demo_scene_wrapper(window_aspect_ratio: float, demo_component: dict) -> DisplayTexture:
+        previous = dict(self.demos)
+        reloaded, affected = reload_demos(self.demos, changed)
+
+        relayout = set(d for d in affected if d not in previous or d not in reloaded or previous[d]["cfg"] != reloaded[d]["cfg"])
+
+        if list(previous.keys()) != list(reloaded.keys()):
+            relayout |= affected
+
+        self.removed_demos = {d: previous[d] for d in previous if d not in reloaded}
+
+        self.demos.clear()
+        self.demos.update(reloaded)
+
+        for d in relayout:
+            self.demo_videos.forget(d)
+
+        self.prefetched = False
+
+        return affected, relayout
+
+def demo_scene_wrapper(window_aspect_ratio: float, demo_component: dict, streaming: dict = None) -> DisplayTexture:
 
     camera_aspect_ratio = 4024.0/3036.0
 
@@ -87,23 +154,33 @@ def demo_scene_wrapper(window_aspect_ratio: float, demo_component: dict) -> Disp
         duration  = 0.75,
         id = "out")
 
-    display = DisplayTexture(
+    # With streaming arguments get_docker_texture is called from a copier thread, woken by
+    # the frame slots it reads from, and frames are uploaded through pixel buffers
+    display_type = StreamingDisplayTexture if streaming is not None else DisplayTexture
+
+    display = display_type(
         position = [2.0, 0.0],
         scale    = [1.0/camera_aspect_ratio, 1.0],
         depth  = 0.95,
         aspect = camera_aspect_ratio,
         animations = {in_animation.id: in_animation, out_animation.id: out_animation},
         id = "demo_display_texture",
-        get_texture = demo_component["get_docker_texture"])
+        get_texture = demo_component["get_docker_texture"],
+        **(streaming or {}))
     
     for c in demo_component["elements"]:
         c.depends_on(element = display)
     
     display.offset[0] = -1.0/camera_aspect_ratio
 
+    # A demo scene may return set_aspect, called when the display is kept for a window
+    # of another aspect ratio, to create its aspect dependent elements again
+    display.demo_aspect = window_aspect_ratio
+    display.demo_set_aspect = demo_component.get("set_aspect")
+
     return display
 
-def demo_video_scene(aspect_ratio: float, video: Video, play: np.array, pause: np.array) -> Element:
+def demo_video_scene(aspect_ratio: float, video: Video, play: np.array, pause: np.array, scheduler: RenderScheduler, restart: bool = True) -> Element:
 
     play_aspect  = play.shape[1]/play.shape[0]
     base_depth = 0.95
@@ -179,7 +256,7 @@ def demo_video_scene(aspect_ratio: float, video: Video, play: np.array, pause: n
     display = DisplayTexture(
         position = [0.0, 0.0],
         scale = [1.0, 1.0],
-        get_texture = lambda g, cd: video.get_frame(),
+        get_texture = scheduler.video_texture(video),
         animations = {ina.id: ina, outa.id: outa},
         id = "traffic_display")
 
@@ -187,32 +264,42 @@ def demo_video_scene(aspect_ratio: float, video: Video, play: np.array, pause: n
     button_pause_play.center_x()
     button_pause_play.animation_play(animation_to_play = "button_in")
 
-    video.reset_and_play()
+    if restart:
+        video.reset_and_play()
 
     return display
 
 
-def scene_primary(windowWidth: int, window_height: int, application_state: State, font: dict) -> Element:
+def scene_primary(windowWidth: int, window_height: int, application_state: State, resources: SceneResources, calibration_zoom_margin: int = 800, texture_streaming: bool = False) -> Element:
     
     camera_aspect_ratio = 4024.0/3036.0
+    calibration_display_scale = 0.62
 
-    demos = load_demos()
-    demo_videos = {}
+    font        = resources.font
+    demos       = resources.demos
 
-    for d in demos:
-        video = Video(path = demos[d]["cfg"]["video"], loop = True)
-        demo_videos[d] = video
+    # Demo displays read the camera and the demo output, streamed ones wake on both and
+    # have the scheduler draw once a frame is ready for upload
+    handler = application_state.echolib_handler
+    demo_streaming = {"slots": [handler.camera_slot, handler.docker_slot], "on_frame": application_state.render_scheduler.wake} if texture_streaming else None
+    demo_videos = resources.demo_videos
 
     aspect_ratio = windowWidth/window_height
-    icon_width  = int( windowWidth*0.1)
-    icon_height = int(window_height*0.1)
 
-    video_icon = rasterize_svg(path = "./res/icons/video-solid.svg",          width = icon_width*1.0, height = icon_height*1.0)
-    point_icon = rasterize_svg(path = "./res/icons/hand-pointer.svg",         width = icon_width*0.7, height = icon_height*0.7)
-    pause_icon = rasterize_svg(path = "./res/icons/pause-circle-regular.svg", width = icon_width*0.7, height = icon_height*0.7)
-    play_icon  = rasterize_svg(path = "./res/icons/play-circle-regular.svg",  width = icon_width*0.7, height = icon_height*0.7)
+    # The demo display spans the window height, frames larger than that are downscaled on arrival
+    application_state.echolib_handler.set_frame_target_size(window_height*camera_aspect_ratio, window_height)
+
+    # A rebuilt scene starts with the calibration drawer closed
+    application_state.echolib_handler.camera_downscaler.enabled = True
+
+    resources.set_window_size(windowWidth, window_height)
 
-    vicos_intro_video = Video(path = "./res/vicos.mp4", loop = False)
+    video_icon = resources.video_icon
+    point_icon = resources.point_icon
+    pause_icon = resources.pause_icon
+    play_icon  = resources.play_icon
+
+    vicos_intro_video = resources.vicos_intro_video
 
     video_icon_aspect_ratio = video_icon.shape[1]/video_icon.shape[0]
     point_icon_aspect_ratio = point_icon.shape[1]/point_icon.shape[0]
@@ -249,7 +336,7 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
         alpha = 1.0,
         animations = {intro_fade_out.id: intro_fade_out, intro_fade_in.id: intro_fade_in},
         id = "vicos_intro_texutre",
-        get_texture = lambda g, cd: vicos_intro_video.get_frame(),
+        get_texture = application_state.render_scheduler.video_texture(vicos_intro_video),
         set_once = False)
 
     header_bar = Container(
@@ -261,7 +348,6 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
 
     header_bar.depends_on(element = display_screen)
     display_screen.insert_default(element = vicos_intro_texture)
-    vicos_intro_video.play()
 
     header_bar.set_depth(depth = display_screen.properties[0] - 0.02)
 
@@ -283,6 +369,9 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
         if len(component.dependent_components[0].dependent_components) > 0:
             return
 
+        # The zoom display needs the full camera resolution
+        application_state.echolib_handler.camera_downscaler.enabled = False
+
         for c in create_calibration_menu():
             c.depends_on(element = component.dependent_components[0])
             c.update_geometry(parent = component.dependent_components[0])
@@ -290,6 +379,8 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
     def calibration_on_close(component, gui: Gui):
         component.dependent_components[0].dependent_components.clear()
 
+        application_state.echolib_handler.camera_downscaler.enabled = True
+
     drawer_menu_calibration = DrawerMenu(
         position = [0.0, 0.9],
         scale    = [1.0, 1.0 + header_height],
@@ -318,22 +409,16 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
 
         # Create live feed component
 
-        def get_original(gui: Gui, state: State):
-            return state.echolib_handler.get_camera_stream()
-
-        def get_zoom(gui: Gui, state: State):
-
-            zoom_margin_y = 800
-            zoom_maring_x = np.int32(np.floor(zoom_margin_y/camera_aspect_ratio))
-
-            image = state.echolib_handler.get_camera_stream()
+        # The margin is given in pixels of the 4024 pixel wide camera frame
+        feed = CalibrationFeed(
+            slot     = application_state.echolib_handler.camera_slot,
+            margin_x = calibration_zoom_margin/4024.0,
+            margin_y = calibration_zoom_margin/4024.0)
 
-            if image is None:
-                return None
-
-            return image[zoom_maring_x:-zoom_maring_x, zoom_margin_y:-zoom_margin_y, :]
+        def get_original(gui: Gui, state: State):
+            return feed.get_original()
 
-        def get_display(position, scale, title, get_texture, id):
+        def get_display(position, scale, title, display_type, id, **kwargs):
 
             calibration_live_feed_container = Container(
                 position = position,
@@ -341,12 +426,12 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
                 colour = [1.0, 1.0, 1.0, 0.8],
                 id = f"calibration_display_container_ {id}") 
 
-            calibration_display_live_feed = DisplayTexture(
+            calibration_display_live_feed = display_type(
                 position = [0.1, 0.07],
                 scale    = [(scale - 0.01)/camera_aspect_ratio, scale - 0.05],
                 aspect = camera_aspect_ratio,
                 id = f"calibration_display_{id}",
-                get_texture = get_texture)
+                **kwargs)
 
             calibration_live_feed_title = TextField(
                     position = [0.05, 0.05],
@@ -363,10 +448,16 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
 
             calibration_display_live_feed.depends_on(element = calibration_live_feed_container)
 
-            return calibration_live_feed_container
+            return calibration_live_feed_container, calibration_display_live_feed
 
-        d_original = get_display(position = [0.025, 0.28], scale = 0.62, title = "Originalna velikost", get_texture = get_original, id = 0)
-        d_zoom     = get_display(position = [0.51,  0.28], scale = 0.62, title = "Povečana velikost",   get_texture = get_zoom, id = 1)
+        # The camera frame is uploaded once, the zoom display crops the original's texture
+        streaming_arguments = {"display_type": StreamingDisplayTexture, "slots": [handler.camera_slot], "on_frame": application_state.render_scheduler.wake} \
+            if texture_streaming else {"display_type": DisplayTexture}
+
+        d_original, original_display = get_display(position = [0.025, 0.28], scale = calibration_display_scale, title = "Originalna velikost",
+            get_texture = get_original, id = 0, **streaming_arguments)
+        d_zoom, _ = get_display(position = [0.51,  0.28], scale = calibration_display_scale, title = "Povečana velikost",
+            display_type = CroppedDisplayTexture, source = original_display, get_crop = feed.get_crop, id = 1)
 
         button_container = Container(
             position = [0.01, 0.08],
@@ -619,6 +710,14 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
     hint = hint_constructor()
     hint.depends_on(element = display_screen)
 
+    def hide_hint():
+
+        # The move loop would otherwise keep running, and the scheduler drawing, while the hint is invisible
+        for a in ("fade_in", "move_0", "move_1"):
+            hint.animation_stop(animation_to_stop = a)
+
+        hint.animation_play(animation_to_play = "fade_out")
+
     # Calibration drawer is going to be drawn over hint
     # and over the demo drawer menu
     drawer_menu_calibration.depends_on(element = display_screen)
@@ -742,22 +841,45 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
         button.animation_play(animation_to_play = "scale_up")
 
         if display_screen.active_video is None:
-            display_screen.insert_active_video(active_video = demo_video_scene(aspect_ratio, demo_videos[video_key], play_icon, pause_icon), active_video_button = button)
+            display_screen.insert_active_video(active_video = demo_video_scene(aspect_ratio, demo_videos[video_key], play_icon, pause_icon, application_state.render_scheduler), active_video_button = button)
+            state.active_video = video_key
 
             button.set_colour(colour = vicos_gray)
         else:
             if button.mouse_click_count % 2 == 0:
                 display_screen.remove_active_video()
+                state.active_video = None
 
                 button.set_colour(colour = vicos_red)
             else:
                 display_screen.active_video_button.mouse_click_count += 1
                 display_screen.active_video_button.set_colour(colour = vicos_red)
 
-                display_screen.insert_active_video(active_video = demo_video_scene(aspect_ratio, demo_videos[video_key], play_icon, pause_icon), active_video_button = button)
+                display_screen.insert_active_video(active_video = demo_video_scene(aspect_ratio, demo_videos[video_key], play_icon, pause_icon, application_state.render_scheduler), active_video_button = button)
+                state.active_video = video_key
 
                 button.set_colour(colour = vicos_gray)
 
+    def insert_demo(demo_key: str, button: Button):
+
+        display = application_state.active_demo_display
+
+        if display is None or application_state.active_demo != demo_key:
+            display = demo_scene_wrapper(aspect_ratio, demos[demo_key]["get_scene"](parameters), demo_streaming)
+
+        elif display.demo_aspect != aspect_ratio:
+            # Kept across a resize. Text scales are fixed at construction, so the scene
+            # creates its text for the new aspect, everything else keeps its state.
+            if display.demo_set_aspect is not None:
+                display.demo_set_aspect(aspect_ratio)
+
+            display.demo_aspect = aspect_ratio
+
+        display_screen.insert_active_demo(active_demo = display, active_demo_button = button)
+
+        application_state.active_demo = demo_key
+        application_state.active_demo_display = display
+
     def on_click_demo_button(button: Button, gui: Gui, custom_data: State):
         
         demo_key = button.id
@@ -765,7 +887,7 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
 
         if display_screen.active_demo is None:
 
-            display_screen.insert_active_demo(active_demo = demo_scene_wrapper(aspect_ratio, demos[demo_key]["get_scene"](parameters)), active_demo_button = button)
+            insert_demo(demo_key, button)
 
             docker_command = "{} {}".format(1, demos[demo_key]["cfg"]["dockerId"])
             custom_data.echolib_handler.append_command((custom_data.echolib_handler.docker_publisher, docker_command))
@@ -776,6 +898,8 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
             if button.mouse_click_count % 2 == 0:
 
                 display_screen.remove_active_demo()
+                custom_data.active_demo = None
+                custom_data.active_demo_display = None
 
                 docker_command = "{} {}".format(-1, demos[demo_key]["cfg"]["dockerId"])
                 custom_data.echolib_handler.append_command((custom_data.echolib_handler.docker_publisher, docker_command))
@@ -793,7 +917,7 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
                 docker_command = "{} {}".format(1, demos[demo_key]["cfg"]["dockerId"])
                 custom_data.echolib_handler.append_command((custom_data.echolib_handler.docker_publisher, docker_command))
 
-                display_screen.insert_active_demo(active_demo = demo_scene_wrapper(aspect_ratio, demos[demo_key]["get_scene"](parameters)), active_demo_button = button)
+                insert_demo(demo_key, button)
 
                 button.set_colour(colour = vicos_gray)
 
@@ -824,6 +948,8 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
 
     def on_grab(element, gui):
 
+        resources.prefetch_demos()
+
         for b in demo_buttons:
             b.animation_stop(animation_to_stop = "position_up")
             b.animation_play(animation_to_play = "position_down")
@@ -831,17 +957,57 @@ def scene_primary(windowWidth: int, window_height: int, application_state: State
             b.animation_stop(animation_to_stop = "position_up")
             b.animation_play(animation_to_play = "position_down")
 
-        hint.animation_play(animation_to_play = "fade_out")
+        hide_hint()
 
     drawer_menu.on_grab  = on_grab
     drawer_menu.on_close = on_close
 
+    #### Restore what was on screen before a rebuild for a new window size
+    # Containers keep running and videos keep their position. The active demo keeps its
+    # display element and scene, everything else is new.
+
+    for b in demo_buttons:
+        if b.id == application_state.active_demo:
+
+            insert_demo(b.id, b)
+
+            b.mouse_click_count = 1
+            b.set_colour(colour = vicos_gray)
+            vicos_intro_texture.animation_play(animation_to_play = "fade_out")
+
+    for b in demo_video_buttons:
+        if b.id == application_state.active_video:
+
+            display_screen.insert_active_video(active_video = demo_video_scene(aspect_ratio, demo_videos[b.id], play_icon, pause_icon, application_state.render_scheduler, restart = False), active_video_button = b)
+
+            b.mouse_click_count = 1
+            b.set_colour(colour = vicos_gray)
+
+    if application_state.active_demo is not None or application_state.active_video is not None:
+        hide_hint()
+
     return display_screen
 
 def main():
 
     print("Starting VICOS DEMO OpenGL")
 
+    CALIBRATION_ZOOM = 800
+    DOWNSCALE = "stride"
+    TEXTURE_STREAMING = True
+    PREFETCH_DEMOS = False
+    WATCH_DEMOS = True
+    BACKGROUND_VIDEO = True
+    CACHE_INTRO_VIDEO = False
+    FRAME_RING = DEFAULT_RING_NAME
+    LATENCY_DUMP = None
+    PROFILER_KEY = "F3"
+    HEADLESS = False
+    DECODE_WORKERS = 2
+    HEADLESS_FRAMES = 600
+    MAX_FPS  = 60.0
+    IDLE_FPS = 10.0
+
     config      = open("./cfg", "r")
     configLines = config.readlines()
     for line in configLines:
@@ -857,37 +1023,174 @@ def main():
             HEIGHT = int(t1)
         elif t0 == "fullscreen":
             FULLSCREEN = t1.lower() == "yes"
+        elif t0 == "calibration_zoom":
+            CALIBRATION_ZOOM = int(t1)
+        elif t0 == "downscale":
+            DOWNSCALE = t1.lower()
+        elif t0 == "texture_streaming":
+            TEXTURE_STREAMING = t1.lower() == "yes"
+        elif t0 == "watch_demos":
+            WATCH_DEMOS = t1.lower() == "yes"
+        elif t0 == "prefetch_demos":
+            PREFETCH_DEMOS = t1.lower() == "yes"
+        elif t0 == "background_video":
+            BACKGROUND_VIDEO = t1.lower() == "yes"
+        elif t0 == "cache_intro_video":
+            CACHE_INTRO_VIDEO = t1.lower() == "yes"
+        elif t0 == "frame_ring":
+            FRAME_RING = None if t1.lower() == "none" else t1
+        elif t0 == "latency_dump":
+            LATENCY_DUMP = None if t1.lower() == "none" else t1
+        elif t0 == "profiler_key":
+            PROFILER_KEY = t1.upper()
+        elif t0 == "headless":
+            HEADLESS = t1.lower() == "yes"
+        elif t0 == "headless_frames":
+            HEADLESS_FRAMES = int(t1)
+        elif t0 == "decode_workers":
+            DECODE_WORKERS = int(t1)
+        elif t0 == "max_fps":
+            MAX_FPS = float(t1)
+        elif t0 == "idle_fps":
+            IDLE_FPS = float(t1)
+
+    # Command line options override cfg
+    parser = argparse.ArgumentParser(description = "Vicos demo GUI")
+    parser.add_argument("--headless", action = "store_true", help = "render offscreen without showing a window")
+    parser.add_argument("--frames", type = int, default = None, help = "number of frames rendered in headless mode, 0 renders until interrupted")
+    parser.add_argument("--dump", type = str, default = None, help = "directory headless frames are written to")
+    parser.add_argument("--dump-format", type = str, default = "png", choices = ["png", "npy"])
+    parser.add_argument("--dump-every", type = int, default = 1, help = "write every n-th frame")
+    args = parser.parse_args()
+
+    HEADLESS = HEADLESS or args.headless
+    HEADLESS_FRAMES = HEADLESS_FRAMES if args.frames is None else args.frames
+
+    if HEADLESS:
+        print(f"Rendering headless: {prepare_headless()}")
+        FULLSCREEN = False
 
     #######################################################
 
-    application_state = State()
+    application_state = State(downscale_method = DOWNSCALE, max_fps = MAX_FPS, idle_fps = IDLE_FPS, frame_ring = FRAME_RING, decode_workers = DECODE_WORKERS)
 
     gui = Gui(fullscreen = FULLSCREEN, width = WIDTH, height = HEIGHT)
 
     font = load_font(path = "./res/fonts/Metropolis-SemiBold.otf")
 
-    scene = scene_primary(gui.width, gui.height, application_state, font)
+    watcher   = DemoWatcher(on_change = application_state.render_scheduler.wake) if WATCH_DEMOS else None
+    resources = SceneResources(gui.width, gui.height, font, prefetch = PREFETCH_DEMOS, watcher = watcher, background_video = BACKGROUND_VIDEO, cache_intro = CACHE_INTRO_VIDEO)
+
+    scene = scene_primary(gui.width, gui.height, application_state, resources, CALIBRATION_ZOOM, TEXTURE_STREAMING)
     scene.update_geometry(parent = None)
 
+    # Render loop profiler overlay, toggled with PROFILER_KEY
+    profiler     = RenderProfiler()
+    profiler_hud = None
+    profiler_key = getattr(glfw, "KEY_" + PROFILER_KEY, glfw.KEY_F3)
+    profiler_key_down = False
+
+    # A press between two idle frames is remembered until it is polled
+    glfw.set_input_mode(glfw.get_current_context(), glfw.STICKY_KEYS, glfw.TRUE)
+
+    # Headless frames are drawn back to back into a framebuffer object
+    offscreen = OffscreenTarget(gui.width, gui.height) if HEADLESS else None
+    dumper    = FrameDumper(args.dump, args.dump_format, args.dump_every) if HEADLESS and args.dump is not None else None
+    frame_index = 0
+
     while not gui.should_window_close():
 
+        if offscreen is None:
+            # Blocks until something needs to be redrawn
+            application_state.render_scheduler.wait()
+        elif HEADLESS_FRAMES > 0 and frame_index >= HEADLESS_FRAMES:
+            break
+
+        profiler.begin_frame()
+
         gui.poll_events()
+
+        if offscreen is not None:
+            offscreen.bind()
+
         gui.clear_screen()
 
+        key_down = glfw.get_key(glfw.get_current_context(), profiler_key) == glfw.PRESS
+
+        if key_down and not profiler_key_down:
+            profiler.toggle()
+            profiler_hud = ProfilerHud(profiler, font, gui.width/gui.height) if profiler.enabled else None
+
+        profiler_key_down = key_down
+
+        if profiler.enabled:
+            profiler.instrument(scene)
+
+        application_state.render_scheduler.track_animations(scene)
+
         scene.execute(parent = None, gui = gui, custom_data = application_state)
+
+        # Pixel buffers of streamed displays that went idle, a closed drawer or a stopped demo
+        StreamingDisplayTexture.release_retired()
+
+        if profiler_hud is not None:
+            profiler_hud.execute(gui = gui, custom_data = application_state)
         
         gui.swap_buffers()
+        application_state.echolib_handler.latency.displayed()
+
+        profiler.end_frame()
 
-        # Resets camera image so no unecessary re-renders are done
-        application_state.echolib_handler.set_camera_to_none()
+        if dumper is not None:
+            dumper(frame_index, offscreen)
 
-        if gui.should_window_resize():
+        frame_index += 1
 
-            scene = scene_primary(gui.width, gui.height, application_state, font)
+        changed_demos, relayout_demos = resources.reload_changed_demos()
+
+        # Demos whose scene module changed are used from their next start. The scene is
+        # only rebuilt when the drawer changes or the demo on screen has to be replaced.
+        rebuild_demos = len(relayout_demos) > 0 or application_state.active_demo in changed_demos
+
+        if len(changed_demos) > 0:
+            print(f"Demos changed on disk: {changed_demos}")
+
+            handler = application_state.echolib_handler
+
+            # The container of a removed demo can no longer be stopped from the drawer
+            if application_state.active_demo in changed_demos and application_state.active_demo not in resources.demos:
+                handler.append_command((handler.docker_publisher, "{} {}".format(-1, resources.removed_demos[application_state.active_demo]["cfg"]["dockerId"])))
+                application_state.active_demo = None
+
+            # A changed demo is built again from its new scene module
+            if application_state.active_demo in changed_demos:
+                application_state.active_demo_display = None
+
+            if application_state.active_video in relayout_demos:
+                application_state.active_video = None
+
+        if gui.should_window_resize() or rebuild_demos:
+
+            # Resources are reused, only the elements are laid out again
+            scene = scene_primary(gui.width, gui.height, application_state, resources, CALIBRATION_ZOOM, TEXTURE_STREAMING)
             scene.update_geometry(parent = None)
 
-    application_state.echolib_handler.running = False
-    application_state.echolib_handler.handler_thread.join()
+            # Wrappers belong to the old elements, the new ones are instrumented on the next frame
+            profiler.uninstrument()
+
+            if profiler_hud is not None:
+                profiler_hud = ProfilerHud(profiler, font, gui.width/gui.height)
+
+    application_state.echolib_handler.close()
+    application_state.echolib_handler.latency.dump(LATENCY_DUMP)
+
+    if offscreen is not None:
+        print(f"Rendered {frame_index} headless frames")
+
+        for line in profiler.report():
+            print(f"    {line}")
+
+        offscreen.release()
 
     glUseProgram(0)
     glfw.terminate()
@@ -0,0 +1,239 @@
+import time
+import numpy as np
+
+from collections import deque
+
+from opengl_gui.gui_components import *
+
+# Elements whose execute time is shown, times include their dependent elements
+PROFILED_ELEMENTS = ("base_display_screen", "header_bar", "vicos_intro_texutre", "drawer_menu", "drawer_menu_calibration",
+                     "demo_display_texture", "traffic_display", "calibration_display_0", "calibration_display_1")
+
+def walk_elements(element):
+
+    # Depth first over dependent components, including the demo and video a
+    # DemoDisplay holds outside of them
+    stack = [element]
+
+    while len(stack) > 0:
+        e = stack.pop()
+        yield e
+
+        stack.extend(getattr(e, "dependent_components", []))
+
+        for attribute in ("active_demo", "active_video"):
+            child = getattr(e, attribute, None)
+            if isinstance(child, Element):
+                stack.append(child)
+
+class RenderProfiler:
+
+    # Measures the render loop while enabled. Frame times come from begin_frame() and
+    # end_frame() around the work of one frame. Element timings and uploaded bytes come
+    # from wrappers put on the execute and get_texture attributes of the elements found
+    # by instrument(), which are removed again on disable, so a hidden profiler only
+    # costs the two timestamps per frame.
+
+    def __init__(self, window: int = 240, elements: tuple = PROFILED_ELEMENTS):
+
+        self.enabled  = False
+        self.elements = elements
+
+        self.frame_times = deque(maxlen = window)
+        self.intervals   = deque(maxlen = window)
+        self.element_times  = {}
+        self.uploaded_bytes = deque(maxlen = window)
+
+        self.instrumented = [] # (element, {attribute: value it had in the element's __dict__ or None})
+        self.current_times = {}
+        self.current_bytes = 0
+        self.stream_bytes  = {}
+
+        self.frame_start = None
+        self.last_start  = None
+
+    def toggle(self):
+
+        self.enabled = not self.enabled
+
+        if not self.enabled:
+            self.uninstrument()
+
+        self.frame_times.clear()
+        self.intervals.clear()
+        self.element_times.clear()
+        self.uploaded_bytes.clear()
+
+    def begin_frame(self):
+
+        now = time.time()
+
+        if self.last_start is not None:
+            self.intervals.append(now - self.last_start)
+
+        self.last_start = self.frame_start = now
+
+    def end_frame(self):
+
+        self.frame_times.append(time.time() - self.frame_start)
+
+        if not self.enabled:
+            return
+
+        for element_id, t in self.current_times.items():
+            self.element_times.setdefault(element_id, deque(maxlen = self.frame_times.maxlen)).append(t)
+
+        # Pixel buffer uploads of StreamingDisplayTexture do not go through get_texture
+        for e, _ in self.instrumented:
+            total = getattr(e, "uploaded_bytes", None)
+            if total is not None:
+                self.current_bytes += total - self.stream_bytes.get(id(e), total)
+                self.stream_bytes[id(e)] = total
+
+        self.uploaded_bytes.append(self.current_bytes)
+
+        self.current_times = {}
+        self.current_bytes = 0
+
+    def instrument(self, scene: Element):
+
+        # Cheap enough to call every frame while enabled, elements inserted since the
+        # last call (a started demo, an opened drawer) are picked up
+        for e in walk_elements(scene):
+
+            if getattr(e, "profiler_wrapped", False):
+                continue
+
+            e.profiler_wrapped = True
+
+            # get_texture is usually the callback stored by the constructor, so the values
+            # found in the instance are put back on uninstrument, not just deleted
+            originals = {a: e.__dict__.get(a) for a in ("execute", "get_texture")}
+            self.instrumented.append((e, originals))
+
+            if getattr(e, "id", None) in self.elements:
+                e.execute = self.__timed(e.id, e.execute)
+
+            get_texture = getattr(e, "get_texture", None)
+            if callable(get_texture):
+                e.get_texture = self.__counted(get_texture)
+
+    def uninstrument(self):
+
+        for e, originals in self.instrumented:
+            for attribute, original in originals.items():
+                if original is not None:
+                    setattr(e, attribute, original)
+                elif attribute in e.__dict__:
+                    delattr(e, attribute)
+
+            if "profiler_wrapped" in e.__dict__:
+                del e.profiler_wrapped
+
+        self.instrumented = []
+        self.stream_bytes = {}
+
+    def __timed(self, element_id, execute):
+
+        def timed_execute(*args, **kwargs):
+            start = time.perf_counter()
+            result = execute(*args, **kwargs)
+            self.current_times[element_id] = self.current_times.get(element_id, 0.0) + time.perf_counter() - start
+
+            return result
+
+        return timed_execute
+
+    def __counted(self, get_texture):
+
+        def counted_get_texture(*args, **kwargs):
+            texture = get_texture(*args, **kwargs)
+
+            if isinstance(texture, np.ndarray):
+                self.current_bytes += texture.nbytes
+
+            return texture
+
+        return counted_get_texture
+
+    def report(self, handler = None) -> list:
+
+        # Lines of text for the HUD, times in milliseconds
+        lines = []
+
+        if len(self.intervals) > 0:
+            lines.append("FPS {:.1f}".format(len(self.intervals)/sum(self.intervals)))
+
+        if len(self.frame_times) > 0:
+            p50, p95, p99 = np.percentile(np.array(self.frame_times), [50, 95, 99])*1000.0
+            lines.append("Frame p50 {:.2f}  p95 {:.2f}  p99 {:.2f} ms".format(p50, p95, p99))
+
+        for element_id in self.elements:
+            if element_id in self.element_times:
+                times = np.array(self.element_times[element_id])*1000.0
+                lines.append("{} {:.2f} ms (max {:.2f})".format(element_id, times.mean(), times.max()))
+
+        if len(self.uploaded_bytes) > 0:
+            lines.append("Uploaded {:.2f} MB/frame".format(np.mean(self.uploaded_bytes)/(1024*1024)))
+
+        if handler is not None:
+            metrics = handler.get_command_metrics()
+            lines.append("Queues docker {} camera {}".format(metrics["docker_queue_depth"], metrics["camera_queue_depth"]))
+
+            for name, m in handler.get_decode_metrics().items():
+                if m["received"] > 0:
+                    lines.append("Decode {} {:.2f} ms, queue {}".format(name, m["decode_mean"]*1000.0, m["queue_depth"]))
+
+        return lines
+
+class ProfilerHud:
+
+    # Text overlay for a RenderProfiler in the top left corner, below the header.
+    # The text is only set again every `period` seconds.
+
+    def __init__(self, profiler: RenderProfiler, font: dict, aspect_ratio: float, lines: int = 14, period: float = 0.25):
+
+        self.profiler = profiler
+        self.font     = font
+        self.period   = period
+        self.last_update = 0.0
+
+        self.container = Container(
+            position = [0.0, 0.05],
+            scale    = [0.4, 0.03*lines + 0.02],
+            depth    = 0.1,
+            colour   = [0.0, 0.0, 0.0, 0.6],
+            id = "profiler_hud")
+
+        self.lines = []
+
+        for i in range(lines):
+            line = TextField(
+                position = [0.02, 0.01 + 0.03*i],
+                text_scale = 0.5,
+                depth  = 0.09,
+                colour = [1.0, 1.0, 1.0, 0.9],
+                aspect_ratio = aspect_ratio,
+                id = f"profiler_hud_line_{i}")
+            line.set_text(font = font, text = " ")
+            line.depends_on(element = self.container)
+
+            self.lines.append(line)
+
+        self.container.update_geometry(parent = None)
+
+    def execute(self, gui, custom_data):
+
+        now = time.time()
+
+        if now - self.last_update > self.period:
+            self.last_update = now
+
+            text = self.profiler.report(custom_data.echolib_handler)
+
+            for i, line in enumerate(self.lines):
+                line.set_text(font = self.font, text = text[i] if i < len(text) else " ")
+
+            self.container.update_geometry(parent = None)
+
+        self.container.execute(parent = None, gui = gui, custom_data = custom_data)
@@ -0,0 +1,146 @@
+import glfw
+import time
+
+from gui_profiler import walk_elements
+
+class RenderScheduler:
+
+    # Decides when the main loop draws the next frame, at most max_fps times a second.
+    # A frame is drawn when
+    #   - input changed (cursor, mouse buttons, window size), and for `linger` seconds
+    #     after it while library elements such as drawer menus settle,
+    #   - an element plays an animation, until its duration has passed (see track_animations),
+    #   - a watched slot publishes a frame while something on screen reads it, that is
+    #     the slot was read on the render thread during the last drawn frame,
+    #   - the time passed to redraw_at() is reached, videos ask for their next frame so,
+    #   - wake() was called.
+    # Otherwise the loop blocks in glfw.wait_events_timeout, drawing at idle_fps only as
+    # a fallback for changes nothing reports.
+
+    def __init__(self, max_fps: float = 60.0, idle_fps: float = 10.0, linger: float = 0.5):
+
+        self.max_fps  = max_fps
+        self.idle_fps = idle_fps
+        self.linger   = linger
+
+        self.dirty = True
+        self.deadline     = float("inf")
+        self.active_until = 0.0
+        self.last_frame   = 0.0
+        self.input_state  = None
+
+    def watch(self, slot):
+
+        slot.add_listener(lambda frame: self.wake() if slot.last_read >= self.last_frame else None)
+
+    def wake(self):
+
+        # Safe to call from any thread, interrupts wait_events_timeout
+        self.dirty = True
+        glfw.post_empty_event()
+
+    def redraw_at(self, when: float):
+
+        # Render thread only, draws a frame no later than `when`
+        self.deadline = min(self.deadline, when)
+
+    def video_texture(self, video):
+
+        # Texture getter for a ThreadedVideo or MappedVideo that schedules the frame on
+        # which its next video frame is due. Other videos, opengl_gui's Video decoding on
+        # the render thread, do not tell when that is and keep the loop drawing instead.
+        next_due = getattr(video, "next_due", None)
+
+        def get_texture(gui, custom_data):
+
+            frame = video.get_frame()
+
+            if next_due is None:
+                self.wake()
+                return frame
+
+            due = next_due()
+
+            if due is not None:
+                self.redraw_at(due)
+
+            return frame
+
+        return get_texture
+
+    def track_animations(self, scene):
+
+        # Cheap enough to call every frame. animation_play of elements not seen before is
+        # wrapped to keep the loop drawing for the duration of the started animation. An
+        # element may have started one while it was built, so a new element counts as
+        # animating for its longest animation.
+        now = time.time()
+
+        for e in walk_elements(scene):
+
+            if getattr(e, "scheduler_tracked", False):
+                continue
+
+            e.scheduler_tracked = True
+
+            animations = getattr(e, "animations", None)
+
+            if not isinstance(animations, dict) or len(animations) == 0:
+                continue
+
+            e.animation_play = self.__tracked(animations, e.animation_play)
+
+            self.active_until = max(self.active_until, now + max(getattr(a, "duration", 0.0) for a in animations.values()))
+
+    def __tracked(self, animations, animation_play):
+
+        def tracked_animation_play(*args, **kwargs):
+            result = animation_play(*args, **kwargs)
+
+            name = kwargs.get("animation_to_play", args[0] if len(args) > 0 else None)
+            self.active_until = max(self.active_until, time.time() + getattr(animations.get(name), "duration", 0.0))
+
+            return result
+
+        return tracked_animation_play
+
+    def wait(self):
+
+        while True:
+
+            now = time.time()
+
+            if self.__input_changed():
+                self.active_until = max(self.active_until, now + self.linger)
+
+            if self.dirty or now < self.active_until or now >= self.deadline:
+                self.dirty    = False
+                self.deadline = float("inf")
+
+                delay = self.last_frame + 1.0/self.max_fps - now
+                if delay > 0.0:
+                    time.sleep(delay)
+                break
+
+            delay = min(self.last_frame + 1.0/self.idle_fps, self.deadline) - now
+            if delay <= 0.0:
+                break
+
+            glfw.wait_events_timeout(delay)
+
+        self.last_frame = time.time()
+
+    def __input_changed(self) -> bool:
+
+        window = glfw.get_current_context()
+
+        if not window:
+            return True
+
+        state = (glfw.get_cursor_pos(window), glfw.get_window_size(window),
+                 glfw.get_mouse_button(window, glfw.MOUSE_BUTTON_LEFT), glfw.get_mouse_button(window, glfw.MOUSE_BUTTON_RIGHT))
+
+        changed = state != self.input_state
+        self.input_state = state
+
+        return changed
@@ -0,0 +1,369 @@
+import ctypes
+import time
+import numpy as np
+
+from threading import Thread, Lock, Event
+
+from OpenGL.GL import *
+
+from opengl_gui.gui_components import DisplayTexture
+
+from gui_frames import defer_uploads, take_deferred_uploads, stamp_uploads
+
+SOFTWARE_RENDERERS = (b"llvmpipe", b"softpipe", b"Software Rasterizer", b"SWR")
+
+def pbo_supported() -> bool:
+
+    # Persistently mapped buffers need GL 4.4 or ARB_buffer_storage. Software
+    # rasterizers expose the extension but gain nothing from it, there is no DMA.
+    try:
+        renderer = glGetString(GL_RENDERER) or b""
+
+        if any(r in renderer for r in SOFTWARE_RENDERERS):
+            return False
+
+        major = glGetIntegerv(GL_MAJOR_VERSION)
+        minor = glGetIntegerv(GL_MINOR_VERSION)
+
+        if (int(major), int(minor)) >= (4, 4):
+            return True
+
+        for i in range(int(glGetIntegerv(GL_NUM_EXTENSIONS))):
+            if glGetStringi(GL_EXTENSIONS, i) == b"GL_ARB_buffer_storage":
+                return True
+
+    except Exception as e:
+        print(f"Could not query pixel buffer support: {e}")
+
+    return False
+
+class PixelBufferRing:
+
+    # Ring of persistently mapped pixel unpack buffers. write() may be called from any
+    # thread and only copies into mapped memory. upload() runs on the render thread,
+    # starts the transfer of the newest written buffer into a texture and fences it,
+    # so the GPU copies the data while the CPU keeps rendering. A buffer is reused
+    # once its fence has signalled. The latency stamps written with a frame are
+    # returned by the upload() that transfers it.
+
+    FREE, WRITING, FILLED, IN_FLIGHT = range(4)
+
+    def __init__(self, size: int, count: int = 3):
+
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+
+        self.size    = size
+        self.buffers = [int(b) for b in np.atleast_1d(glGenBuffers(count))]
+        self.pointers = []
+
+        for b in self.buffers:
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, b)
+            glBufferStorage(GL_PIXEL_UNPACK_BUFFER, size, None, flags)
+            self.pointers.append(ctypes.cast(glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, size, flags), ctypes.c_void_p).value)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.lock   = Lock()
+        self.state  = [self.FREE]*count
+        self.shapes = [None]*count
+        self.order  = [0]*count
+        self.fences = [None]*count
+        self.stamps = [[]]*count
+        self.counter = 0
+
+    def write(self, image: np.ndarray, stamps: list = ()) -> bool:
+
+        with self.lock:
+            # Prefer a free buffer, otherwise overwrite the oldest frame not yet uploaded
+            candidates = [i for i, s in enumerate(self.state) if s == self.FREE]
+            if len(candidates) == 0:
+                candidates = sorted([i for i, s in enumerate(self.state) if s == self.FILLED], key = lambda i: self.order[i])
+
+            if len(candidates) == 0 or image.nbytes > self.size:
+                return False
+
+            index = candidates[0]
+            self.state[index] = self.WRITING
+
+        target = np.ctypeslib.as_array(ctypes.cast(self.pointers[index], ctypes.POINTER(ctypes.c_uint8)), shape = (image.nbytes,))
+        np.copyto(target.reshape(image.shape), image)
+
+        with self.lock:
+            self.counter += 1
+            self.order[index]  = self.counter
+            self.shapes[index] = image.shape
+            self.stamps[index] = list(stamps)
+            self.state[index]  = self.FILLED
+
+        return True
+
+    def upload(self, texture: int) -> list:
+
+        # Stamps of the transferred frame, None when there was nothing to transfer
+        self.__retire()
+
+        with self.lock:
+            filled = [i for i, s in enumerate(self.state) if s == self.FILLED]
+
+            if len(filled) == 0:
+                return None
+
+            index = max(filled, key = lambda i: self.order[i])
+            self.state[index] = self.IN_FLIGHT
+
+            stamps, self.stamps[index] = self.stamps[index], []
+
+            # Older frames are superseded
+            for i in filled:
+                if i != index:
+                    self.state[i] = self.FREE
+
+        height, width = self.shapes[index][0], self.shapes[index][1]
+        bound = glGetIntegerv(GL_TEXTURE_BINDING_2D)
+
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffers[index])
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+
+        # Must be unbound, otherwise client memory uploads elsewhere are read as buffer offsets
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        glBindTexture(GL_TEXTURE_2D, bound)
+
+        self.fences[index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+        return stamps
+
+    def release(self):
+
+        for i, b in enumerate(self.buffers):
+            if self.fences[i] is not None:
+                glDeleteSync(self.fences[i])
+
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, b)
+            glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        glDeleteBuffers(len(self.buffers), self.buffers)
+
+    def __retire(self):
+
+        for i, fence in enumerate(self.fences):
+            if fence is None:
+                continue
+
+            if glClientWaitSync(fence, 0, 0) in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                glDeleteSync(fence)
+                self.fences[i] = None
+
+                with self.lock:
+                    self.state[i] = self.FREE
+
+class StreamingDisplayTexture(DisplayTexture):
+
+    # DisplayTexture whose frames are copied into a PixelBufferRing by a background
+    # thread. get_texture keeps its usual signature but is called from the copier
+    # thread, so it must not touch GL. Frames that change the texture size, and all
+    # frames when pixel buffers are unavailable, take the regular DisplayTexture path.
+    # The copier thread stops when the element has not been drawn for idle_timeout
+    # seconds (demo switched, drawer closed) and starts again on the next draw. Its
+    # pixel buffers are retired then, the render loop frees them with release_retired()
+    # and a new ring is created if the element is drawn again.
+    #
+    # Between frames the copier sleeps until one of the FrameSlots in `slots` that
+    # get_texture reads from publishes or is notified. Getters that do not read from
+    # a slot are polled every 2 ms instead. on_frame is called from the copier thread
+    # once a frame is ready to be uploaded on the next draw.
+
+    # Rings of elements that went idle, waiting to be freed on the render thread
+    retired = []
+    retired_lock = Lock()
+
+    def __init__(self, get_texture, slots: list = (), on_frame = None, buffers: int = 3, idle_timeout: float = 1.0, **kwargs):
+
+        super().__init__(get_texture = self.__get_texture, **kwargs)
+
+        self.get_frame = get_texture
+        self.buffers   = buffers
+        self.idle_timeout = idle_timeout
+
+        self.slots = list(slots)
+        self.on_frame = on_frame
+        self.frame_ready = Event()
+        self.wake = lambda frame: self.frame_ready.set()
+
+        self.streaming = None
+        self.ring      = None
+        self.uploaded_shape = None
+        self.reshape_frame  = None
+
+        self.lock = Lock()
+        self.ring_lock = Lock()
+        self.copier = None
+        self.last_draw = 0.0
+
+        # Bytes transferred through pixel buffers, read by the profiler
+        self.uploaded_bytes = 0
+
+    def __get_texture(self, gui, custom_data):
+
+        if self.streaming is None:
+            self.streaming = pbo_supported() and isinstance(getattr(self, "texture", None), (int, np.integer))
+            print(f"Texture streaming for {self.id}: {'pixel buffers' if self.streaming else 'DisplayTexture fallback'}")
+
+        if not self.streaming:
+            return self.get_frame(gui, custom_data)
+
+        self.last_draw = time.time()
+        self.__ensure_copier(gui, custom_data)
+
+        with self.lock:
+            reshape, self.reshape_frame = self.reshape_frame, None
+
+        if reshape is not None:
+            frame, stamps = reshape
+
+            # New size, let DisplayTexture reallocate the texture and size a new ring for it
+            with self.ring_lock:
+                if self.ring is not None:
+                    self.ring.release()
+                    self.ring = None
+
+                self.uploaded_shape = frame.shape
+
+            # DisplayTexture uploads it right after this returns
+            stamp_uploads(stamps)
+
+            return frame
+
+        with self.ring_lock:
+            if self.ring is None and self.uploaded_shape is not None and len(self.uploaded_shape) == 3:
+                self.ring = PixelBufferRing(size = int(np.prod(self.uploaded_shape)), count = self.buffers)
+
+            ring = self.ring
+
+        # A ring retired meanwhile is only freed by release_retired() later on this thread
+        stamps = ring.upload(int(self.texture)) if ring is not None else None
+
+        if stamps is not None:
+            self.uploaded_bytes += int(np.prod(self.uploaded_shape))
+            stamp_uploads(stamps)
+
+        return None
+
+    @staticmethod
+    def release_retired():
+
+        # Render thread only, called once a frame. Frees the pixel buffers of elements
+        # whose copier stopped, which includes elements no longer in the scene.
+        with StreamingDisplayTexture.retired_lock:
+            retired, StreamingDisplayTexture.retired = StreamingDisplayTexture.retired, []
+
+        for ring in retired:
+            ring.release()
+
+    def __ensure_copier(self, gui, custom_data):
+
+        if self.copier is not None and self.copier.is_alive():
+            return
+
+        self.copier = Thread(target = self.__copy, args = (gui, custom_data), daemon = True)
+        self.copier.start()
+
+    def __copy(self, gui, custom_data):
+
+        for slot in self.slots:
+            slot.add_listener(self.wake)
+
+        # Frames read here reach the texture later, their latency is stamped on upload
+        defer_uploads()
+
+        try:
+            while time.time() - self.last_draw < self.idle_timeout:
+
+                # Cleared before reading, a frame published in between sets it again
+                self.frame_ready.clear()
+                frame  = self.get_frame(gui, custom_data)
+                stamps = take_deferred_uploads()
+
+                if frame is None:
+                    self.frame_ready.wait(self.idle_timeout if len(self.slots) > 0 else 0.002)
+                    continue
+
+                streamable = frame.dtype == np.uint8 and frame.ndim == 3 and frame.shape[2] == 3
+
+                with self.ring_lock:
+                    if streamable and frame.shape == self.uploaded_shape and self.ring is not None:
+                        self.ring.write(frame, stamps)
+                    else:
+                        with self.lock:
+                            self.reshape_frame = (frame, stamps)
+
+                if self.on_frame is not None:
+                    self.on_frame()
+
+        finally:
+            for slot in self.slots:
+                slot.remove_listener(self.wake)
+
+            # Mapped buffers of a full size camera frame are large, a dropped element
+            # must not keep them
+            with self.ring_lock:
+                ring, self.ring = self.ring, None
+
+            if ring is not None:
+                with StreamingDisplayTexture.retired_lock:
+                    StreamingDisplayTexture.retired.append(ring)
+
+class CroppedDisplayTexture(DisplayTexture):
+
+    # DisplayTexture showing a sub-rectangle of the texture of another display, so both
+    # draw from a single upload. The rectangle is sampled on the GPU with a linear
+    # framebuffer blit into this element's own texture, which is allocated once per
+    # crop size. get_crop returns the (x0, y0, x1, y1) pixel rectangle of the source
+    # frame, or None while the source holds no frame.
+
+    # Read and draw framebuffer for the blits, shared by all instances
+    framebuffers = None
+
+    def __init__(self, source: DisplayTexture, get_crop, **kwargs):
+
+        super().__init__(get_texture = self.__get_texture, **kwargs)
+
+        self.source   = source
+        self.get_crop = get_crop
+
+        self.crop_size = None
+
+    def __get_texture(self, gui, custom_data):
+
+        crop = self.get_crop()
+        source_texture = getattr(self.source, "texture", None)
+
+        if crop is None or not isinstance(source_texture, (int, np.integer)):
+            return None
+
+        x0, y0, x1, y1 = crop
+
+        if (x1 - x0, y1 - y0) != self.crop_size:
+            # Let DisplayTexture allocate a texture of the crop size, filled on the next draw
+            self.crop_size = (x1 - x0, y1 - y0)
+            return np.zeros((y1 - y0, x1 - x0, 3), dtype = np.uint8)
+
+        if CroppedDisplayTexture.framebuffers is None:
+            CroppedDisplayTexture.framebuffers = [int(f) for f in np.atleast_1d(glGenFramebuffers(2))]
+
+        read_bound = glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING)
+        draw_bound = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+
+        # Rows are uploaded top first into both textures, so no flip is needed
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffers[0])
+        glFramebufferTexture2D(GL_READ_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, int(source_texture), 0)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.framebuffers[1])
+        glFramebufferTexture2D(GL_DRAW_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, int(self.texture), 0)
+
+        glBlitFramebuffer(x0, y0, x1, y1, 0, 0, x1 - x0, y1 - y0, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, read_bound)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, draw_bound)
+
+        return None
@@ -0,0 +1,254 @@
+import cv2
+import time
+import numpy as np
+
+from threading import Thread, Condition
+from collections import deque
+
+class ThreadedVideo():
+
+    # Drop-in replacement for opengl_gui's Video that decodes on a worker thread into a
+    # small ring of preallocated RGB frames. get_frame() returns the newest frame whose
+    # presentation time has passed and None while no new frame is due, so the texture
+    # is kept without an upload. The worker stops decoding while the video is paused,
+    # after it ended, and when get_frame() has not been called for idle_timeout seconds
+    # (the display showing it was removed); it starts again on the next get_frame().
+
+    def __init__(self, path: str, loop: bool = False, buffers: int = 4, idle_timeout: float = 0.5):
+
+        self.path = path
+        self.loop = loop
+        self.idle_timeout = idle_timeout
+
+        self.capture = cv2.VideoCapture(path)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 25.0
+
+        self.buffers = [None]*max(3, buffers)
+        self.free    = deque(range(len(self.buffers)))
+        self.ready   = deque() # (buffer index, presentation time)
+        self.held    = None    # Buffer returned by the last get_frame
+
+        self.condition = Condition()
+        self.worker    = None
+
+        self.playing = False
+        self.ended   = False
+        self.decoded = 0       # Frames decoded since the start, including earlier loops
+        self.clock_start = 0.0 # Wall time corresponding to presentation time 0
+        self.paused_at   = None
+        self.last_request = 0.0
+
+    def play(self):
+
+        with self.condition:
+            self.playing = True
+            self.clock_start = time.time() - self.decoded/self.fps if self.decoded > 0 else time.time()
+            self.paused_at = None
+
+        self.__ensure_worker()
+
+    def reset_and_play(self):
+
+        with self.condition:
+            self.playing = False
+            self.condition.notify_all()
+
+        if self.worker is not None:
+            self.worker.join()
+
+        with self.condition:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.free.extend(i for i, _ in self.ready)
+            self.ready.clear()
+            self.decoded = 0
+            self.ended   = False
+
+        self.play()
+
+    def pause(self):
+
+        with self.condition:
+            if self.playing:
+                self.playing = False
+                self.paused_at = time.time()
+                self.condition.notify_all()
+
+    def resume(self):
+
+        with self.condition:
+            if self.paused_at is not None:
+                self.clock_start += time.time() - self.paused_at
+                self.paused_at = None
+
+            self.playing = True
+
+        self.__ensure_worker()
+
+    def get_frame(self):
+
+        self.last_request = time.time()
+        self.__ensure_worker()
+
+        with self.condition:
+            if not self.playing:
+                return None
+
+            clock = time.time() - self.clock_start
+            frame = None
+
+            # Skip late frames, the newest due frame is shown
+            while len(self.ready) > 0 and self.ready[0][1] <= clock:
+                index, pts = self.ready.popleft()
+
+                if frame is not None:
+                    self.free.append(frame)
+                frame = index
+
+            if frame is None:
+                return None
+
+            # The previously returned buffer is no longer read by the render thread
+            if self.held is not None:
+                self.free.append(self.held)
+            self.held = frame
+
+            self.condition.notify_all()
+
+        return self.buffers[frame]
+
+    def next_due(self) -> float:
+
+        # Wall time at which get_frame() returns the next frame, None while paused or ended
+        with self.condition:
+            if not self.playing or (self.ended and len(self.ready) == 0):
+                return None
+
+            if len(self.ready) > 0:
+                return self.clock_start + self.ready[0][1]
+
+            # Not decoded yet, ask again in half a frame rather than spinning on a late frame
+            return max(self.clock_start + self.decoded/self.fps, time.time() + 0.5/self.fps)
+
+    def __ensure_worker(self):
+
+        with self.condition:
+            if not self.playing or self.ended or (self.worker is not None and self.worker.is_alive()):
+                return
+
+            # Decoding stopped while the video was hidden, continue from the next decoded
+            # frame instead of racing through the frames that would have been shown
+            if self.decoded > 0:
+                self.clock_start = time.time() - (self.ready[0][1] if len(self.ready) > 0 else self.decoded/self.fps)
+
+            self.worker = Thread(target = self.__decode, daemon = True)
+            self.worker.start()
+
+    def __decode(self):
+
+        decode_buffer = None
+
+        while True:
+
+            with self.condition:
+                while self.playing and len(self.free) == 0 and time.time() - self.last_request < self.idle_timeout:
+                    self.condition.wait(0.05)
+
+                if not self.playing or time.time() - self.last_request >= self.idle_timeout:
+                    return
+
+                index = self.free.popleft()
+
+            ok, decode_buffer = self.capture.read(decode_buffer)
+
+            if not ok and self.loop and self.decoded > 0:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, decode_buffer = self.capture.read(decode_buffer)
+
+            if not ok:
+                with self.condition:
+                    self.free.append(index)
+                    self.ended = True
+                return
+
+            if self.buffers[index] is None or self.buffers[index].shape != decode_buffer.shape:
+                self.buffers[index] = np.empty_like(decode_buffer)
+
+            cv2.cvtColor(decode_buffer, cv2.COLOR_BGR2RGB, dst = self.buffers[index])
+
+            with self.condition:
+                self.ready.append((index, self.decoded/self.fps))
+                self.decoded += 1
+
+class MappedVideo():
+
+    # Plays frames pre-decoded by gui_cache.transcode_video straight from the memory
+    # mapped cache file, there is no decoding at all. Same interface and get_frame()
+    # semantics as ThreadedVideo.
+
+    def __init__(self, frames: np.ndarray, fps: float, loop: bool = False):
+
+        self.frames = frames
+        self.fps    = fps
+        self.loop   = loop
+
+        self.playing = False
+        self.clock_start = 0.0
+        self.paused_at   = None
+        self.shown = -1
+
+    def play(self):
+
+        self.playing = True
+        self.clock_start = time.time() - max(0, self.shown)/self.fps
+        self.paused_at = None
+
+    def reset_and_play(self):
+
+        self.shown = -1
+        self.play()
+
+    def pause(self):
+
+        if self.playing:
+            self.playing = False
+            self.paused_at = time.time()
+
+    def resume(self):
+
+        if self.paused_at is not None:
+            self.clock_start += time.time() - self.paused_at
+            self.paused_at = None
+
+        self.playing = True
+
+    def get_frame(self):
+
+        if not self.playing:
+            return None
+
+        index = int((time.time() - self.clock_start)*self.fps)
+
+        if self.loop:
+            index %= len(self.frames)
+        elif index >= len(self.frames):
+            index = len(self.frames) - 1
+
+        if index == self.shown:
+            return None
+
+        self.shown = index
+
+        return self.frames[index]
+
+    def next_due(self) -> float:
+
+        # Wall time at which get_frame() returns the next frame, None while paused or ended
+        if not self.playing:
+            return None
+
+        index = int((time.time() - self.clock_start)*self.fps) + 1
+
+        if not self.loop and index >= len(self.frames):
+            return None
+
+        return self.clock_start + index/self.fps
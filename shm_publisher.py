@@ -0,0 +1,80 @@
+import echolib
+
+import time
+import argparse
+import numpy as np
+
+from shm_ring import SharedFrameRing, DEFAULT_RING_NAME, FRAME_RING_CHANNEL
+
+class RingPublisher():
+
+    # What a demo container does to send a frame through the shared memory ring:
+    # write the pixels into the ring and announce "N K" on echolib.
+
+    def __init__(self, client, ring: SharedFrameRing):
+
+        self.ring = ring
+        self.publisher = echolib.Publisher(client, FRAME_RING_CHANNEL, "string")
+
+    def send(self, image: np.ndarray, timestamp: float = None):
+
+        sequence, slot = self.ring.write(image, timestamp)
+
+        w = echolib.MessageWriter()
+        w.writeString(f"{sequence} {slot}")
+        self.publisher.send(w)
+
+def main():
+
+    # Stands in for a demo container when testing the shared memory transport locally.
+    # Publishes a moving test pattern, run it with the GUI and an echolib daemon.
+
+    parser = argparse.ArgumentParser(description = "Shared memory frame ring test publisher")
+    parser.add_argument("--ring", type = str, default = DEFAULT_RING_NAME, help = "name of the frame ring")
+    parser.add_argument("--create", action = "store_true", help = "create the ring instead of attaching to the one of the docker manager")
+    parser.add_argument("--width",  type = int, default = 1920)
+    parser.add_argument("--height", type = int, default = 1080)
+    parser.add_argument("--fps",    type = float, default = 30.0)
+    args = parser.parse_args()
+
+    if args.create:
+        ring = SharedFrameRing.create(args.ring, slot_bytes = args.width*args.height*3)
+    else:
+        ring = SharedFrameRing.attach(args.ring)
+
+    loop   = echolib.IOLoop()
+    client = echolib.Client()
+    loop.add_handler(client)
+
+    publisher = RingPublisher(client, ring)
+
+    x = np.arange(args.width, dtype = np.uint16)
+    image = np.empty((args.height, args.width, 3), dtype = np.uint8)
+    image[:, :, 1] = np.linspace(0, 255, args.height, dtype = np.uint8)[:, None]
+    image[:, :, 2] = 128
+
+    frame = 0
+    start = time.time()
+
+    try:
+        while loop.wait(1):
+
+            image[:, :, 0] = ((x + frame*8) % 256).astype(np.uint8)[None, :]
+            publisher.send(image)
+            frame += 1
+
+            # Keep the frame rate without drifting
+            delay = start + frame/args.fps - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            if frame % int(args.fps) == 0:
+                print(f"Published {frame} frames, {frame/(time.time() - start):.1f} fps")
+
+    except KeyboardInterrupt:
+        pass
+
+    ring.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import time
+import struct
+import numpy as np
+
+from multiprocessing import shared_memory, resource_tracker
+
+# Shared memory frame ring used by demo containers to hand frames to the GUI without
+# sending the pixels through echolib. The ring lives in POSIX shared memory
+# (/dev/shm/<name>), which the docker manager bind mounts into every demo container.
+# The writer copies a frame into slot K = N % slots and announces "N K" on the
+# FRAME_RING_CHANNEL echolib channel, readers map the slot as a numpy array.
+#
+# Layout: a ring header followed by slots, each a slot header and the pixel data.
+# The slot header holds a sequence counter used like a seqlock: it is odd while
+# the writer fills the slot and 2*N once frame N is complete, so a reader can tell
+# whether the slot still holds the frame it was told about.
+
+DEFAULT_RING_NAME  = "vicos_demo_frames"
+FRAME_RING_CHANNEL = "docker_demo_output_shm"
+
+RING_HEADER = struct.Struct("<4sIIQQ") # magic, version, slots, slot bytes, next sequence
+SLOT_HEADER = struct.Struct("<QIIId")  # sequence, height, width, channels, timestamp
+PAGE        = 4096 # Each header takes a page, so pixel data is page aligned
+SHM_ROOT    = "/dev/shm"
+
+MAGIC   = b"VFRM"
+VERSION = 1
+
+def open_shared_memory(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+
+    if create:
+        return shared_memory.SharedMemory(name = name, create = True, size = size)
+
+    try:
+        return shared_memory.SharedMemory(name = name, track = False)
+    except TypeError:
+        # Before Python 3.13 an attached segment is registered with the resource tracker,
+        # which would unlink it when this process exits. Only the creator may unlink.
+        memory = shared_memory.SharedMemory(name = name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+
+        return memory
+
+def slot_stride(slot_bytes: int) -> int:
+
+    return PAGE + ((slot_bytes + PAGE - 1)//PAGE)*PAGE
+
+class SharedFrameRing:
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool = False):
+
+        self.memory = memory
+        self.owner  = owner
+
+        magic, version, self.slots, self.slot_bytes, _ = RING_HEADER.unpack_from(memory.buf, 0)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Shared memory {memory.name} is not a version {VERSION} frame ring")
+
+        self.slot_stride = slot_stride(self.slot_bytes)
+
+        # Identifies the segment behind the name, see replaced()
+        try:
+            self.inode = os.stat(os.path.join(SHM_ROOT, memory.name.lstrip("/"))).st_ino
+        except OSError:
+            self.inode = None
+
+    @staticmethod
+    def create(name: str = DEFAULT_RING_NAME, slots: int = 4, slot_bytes: int = 4024*3036*3) -> "SharedFrameRing":
+
+        # Removes a segment left behind by a previous run with the same name
+        try:
+            stale = shared_memory.SharedMemory(name = name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        memory = open_shared_memory(name, create = True, size = PAGE + slots*slot_stride(slot_bytes))
+
+        RING_HEADER.pack_into(memory.buf, 0, MAGIC, VERSION, slots, slot_bytes, 1)
+
+        return SharedFrameRing(memory, owner = True)
+
+    @staticmethod
+    def attach(name: str = DEFAULT_RING_NAME) -> "SharedFrameRing":
+
+        return SharedFrameRing(open_shared_memory(name))
+
+    def __slot_offset(self, slot: int) -> int:
+
+        return PAGE + slot*self.slot_stride
+
+    def write(self, image: np.ndarray, timestamp: float = None) -> tuple:
+
+        # Copies image into the next slot and returns (sequence, slot) for the
+        # notification. There is a single writer, the active demo container.
+        if image.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {image.nbytes} bytes does not fit into {self.slot_bytes} byte slots")
+
+        header = RING_HEADER.unpack_from(self.memory.buf, 0)
+        sequence = header[4]
+        slot     = sequence % self.slots
+        offset   = self.__slot_offset(slot)
+
+        height, width = image.shape[0], image.shape[1]
+        channels = image.shape[2] if image.ndim == 3 else 1
+
+        SLOT_HEADER.pack_into(self.memory.buf, offset, 2*sequence - 1, height, width, channels, 0.0)
+
+        target = np.ndarray(image.shape, dtype = np.uint8, buffer = self.memory.buf, offset = offset + PAGE)
+        np.copyto(target, image)
+
+        SLOT_HEADER.pack_into(self.memory.buf, offset, 2*sequence, height, width, channels, time.time() if timestamp is None else timestamp)
+        RING_HEADER.pack_into(self.memory.buf, 0, MAGIC, VERSION, self.slots, self.slot_bytes, sequence + 1)
+
+        return sequence, slot
+
+    def read(self, sequence: int, slot: int) -> tuple:
+
+        # Returns (image, timestamp) with image a view into the slot, or None when the
+        # slot no longer holds frame sequence. The view is only stable until the writer
+        # comes around the ring again, use valid() to check after using it.
+        if slot < 0 or slot >= self.slots:
+            return None
+
+        offset = self.__slot_offset(slot)
+        stored, height, width, channels, timestamp = SLOT_HEADER.unpack_from(self.memory.buf, offset)
+
+        if stored != 2*sequence:
+            return None
+
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        image = np.ndarray(shape, dtype = np.uint8, buffer = self.memory.buf, offset = offset + PAGE)
+
+        return image, timestamp
+
+    def valid(self, sequence: int, slot: int) -> bool:
+
+        return SLOT_HEADER.unpack_from(self.memory.buf, self.__slot_offset(slot))[0] == 2*sequence
+
+    def replaced(self) -> bool:
+
+        # True when the name no longer refers to the mapped segment, because a restarted
+        # docker manager unlinked it and created a new one. Readers attach again then.
+        if self.inode is None:
+            return False
+
+        try:
+            return os.stat(os.path.join(SHM_ROOT, self.memory.name.lstrip("/"))).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
+
+    def close(self):
+
+        try:
+            self.memory.close()
+        except BufferError:
+            # Views handed out by read() are still alive, the mapping goes away with the process
+            pass
+
+        if self.owner:
+            self.memory.unlink()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The GUI modules are imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gui_detection_messages import parse_detections
+
+def test_parse_normalizes_coordinates():
+
+    detections = parse_detections('{"sequence": 3, "timestamp": 1.5, "width": 10, "height": 20,'
+                                  ' "boxes": [{"box": [1, 2, 3, 4], "label": "tile", "score": 0.5}],'
+                                  ' "polygons": [{"points": [[1, 2], [3, 4]]}], "counts": {"tile": 1}}')
+
+    assert detections.sequence == 3
+    assert detections.timestamp == 1.5
+    assert detections.boxes == [((0.1, 0.1, 0.3, 0.2), "tile", 0.5)]
+    assert detections.polygons == [([(0.1, 0.1), (0.3, 0.2)], None, None)]
+    assert detections.counts == {"tile": 1}
+
+@pytest.mark.parametrize("text", [
+    "not json", "[1]", '"x"', "null",
+    '{"width": 0}', '{"height": -1}', '{"width": "nan"}',
+    '{"counts": [1]}', '{"sequence": 1e400}',
+    '{"boxes": 5}', '{"boxes": [5]}', '{"boxes": [{"box": [1, 2, 3]}]}', '{"boxes": [{"box": ["a", 2, 3, 4]}]}',
+    '{"boxes": [{"box": [1, 2, 3, 4], "score": "high"}]}',
+    '{"polygons": [{"points": [1]}]}'])
+def test_parse_rejects_malformed(text):
+
+    assert parse_detections(text) is None
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+
+import pytest
+
+# The GUI modules are imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for module in ("numpy", "cv2", "glfw", "opengl_gui"):
+    pytest.importorskip(module)
+
+import gui_cache
+
+from gui_main  import SceneResources
+from gui_demos import load_demos, LazyVideos
+
+CFG = """<?xml version="1.0" encoding="UTF-8"?>
+<cfg>
+    <demoId>{demo_id}</demoId>
+    <dockerId>{docker_id}</dockerId>
+    <highlight>{demo_id}</highlight>
+    <video>preview.mp4</video>
+</cfg>
+"""
+
+class ChangedDemos:
+
+    # Stands in for DemoWatcher, reports the given demo directories once
+    def __init__(self):
+
+        self.changed = set()
+
+    def changes(self) -> set:
+
+        changed, self.changed = self.changed, set()
+
+        return changed
+
+def write_demo(root, name: str, demo_id: str, docker_id: str = "image"):
+
+    directory = root/"demos"/name
+    directory.mkdir(parents = True, exist_ok = True)
+
+    (directory/"cfg.xml").write_text(CFG.format(demo_id = demo_id, docker_id = docker_id))
+    (directory/"scene.py").write_text("def get_scene(parameters):\n    return {}\n")
+
+    # The manifest compares modification times, which may not move within a test
+    later = time.time_ns() + 10**9
+    for path in (directory, directory/"cfg.xml", directory/"scene.py", root/"demos"):
+        os.utime(path, ns = (later, later))
+
+@pytest.fixture
+def resources(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(gui_cache, "CACHE_ROOT", str(tmp_path/"cache"))
+    monkeypatch.chdir(tmp_path)
+
+    write_demo(tmp_path, "First",  "D1")
+    write_demo(tmp_path, "Second", "D2")
+
+    # Only what reload_changed_demos uses, without a window for icons and videos
+    resources = SceneResources.__new__(SceneResources)
+    resources.demos = load_demos()
+    resources.demo_videos = LazyVideos(resources.demos)
+    resources.watcher = ChangedDemos()
+    resources.removed_demos = {}
+    resources.prefetched = False
+
+    return resources
+
+def test_nothing_changed(resources):
+
+    assert resources.reload_changed_demos() == (set(), set())
+
+def test_changed_scene_keeps_layout(resources, tmp_path):
+
+    (tmp_path/"demos"/"First"/"scene.py").write_text("def get_scene(parameters):\n    return {'elements': []}\n")
+    resources.watcher.changed = {"First"}
+
+    changed, relayout = resources.reload_changed_demos()
+
+    assert changed == {"D1"}
+    assert relayout == set()
+    assert resources.demos["D1"]["get_scene"].reload
+
+def test_changed_cfg_relayouts(resources, tmp_path):
+
+    write_demo(tmp_path, "First",  "D1", docker_id = "other")
+    write_demo(tmp_path, "Second", "D2", docker_id = "other")
+    resources.watcher.changed = {"First", "Second"}
+
+    changed, relayout = resources.reload_changed_demos()
+
+    assert changed == {"D1", "D2"}
+    assert relayout == {"D1", "D2"}
+    assert resources.demos["D1"]["cfg"]["dockerId"] == "other"
+
+def test_added_and_removed_demos(resources, tmp_path):
+
+    write_demo(tmp_path, "Third", "D3")
+    (tmp_path/"demos"/"Second"/"cfg.xml").unlink()
+    resources.watcher.changed = {"Second", "Third"}
+
+    changed, relayout = resources.reload_changed_demos()
+
+    assert changed == {"D2", "D3"}
+    assert relayout == {"D2", "D3"}
+    assert "D2" in resources.removed_demos
+    assert set(resources.demos.keys()) == {"D1", "D3"}
+
+def test_half_saved_cfg_drops_demo(resources, tmp_path):
+
+    (tmp_path/"demos"/"First"/"cfg.xml").write_text("<?xml version=\"1.0\"?>\n<cfg>\n    <demoId>D1")
+    resources.watcher.changed = {"First"}
+
+    changed, relayout = resources.reload_changed_demos()
+
+    assert changed == {"D1"}
+    assert "D1" not in resources.demos
+
+    write_demo(tmp_path, "First", "D1")
+    resources.watcher.changed = {"First"}
+
+    changed, relayout = resources.reload_changed_demos()
+
+    assert "D1" in resources.demos